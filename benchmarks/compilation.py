@@ -0,0 +1,111 @@
+"""SQLAlchemy compile time per statement of the pycalcite dialect
+
+Needs SQLAlchemy but no JVM. Every statement is built anew per run, as
+applications do per request, and compiled once without a compiled cache,
+i.e. from scratch as before the dialect enabled statement caching, and
+once through a compiled cache like the one of an Engine::
+
+    python benchmarks/compilation.py --repeat 2000 --output compile.json
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _summary(samples):
+    return dict(median=statistics.median(samples), min=min(samples), max=max(samples), runs=len(samples))
+
+
+def _statements():
+    """name -> function building one statement, over Core tables and ORM classes of the benchmark datasets"""
+    from sqlalchemy import Column, Integer, MetaData, Numeric, String, Table, ForeignKey, func, select
+    from sqlalchemy.orm import declarative_base, relationship
+
+    metadata = MetaData()
+    orders = Table('ORDERS', metadata, Column('ID', Integer), Column('CUSTOMER_ID', Integer),
+                   Column('AMOUNT', Numeric), Column('STATUS', String), schema='CSV')
+    customers = Table('CUSTOMERS', metadata, Column('ID', Integer), Column('NAME', String),
+                      Column('REGION', String), schema='CSV')
+
+    Base = declarative_base()
+
+    class Customer(Base):
+        __tablename__ = 'CUSTOMERS'
+        __table_args__ = {'schema': 'DIALECT'}
+        ID = Column(Integer, primary_key=True)
+        NAME = Column(String)
+        REGION = Column(String)
+
+    class Order(Base):
+        __tablename__ = 'ORDERS'
+        __table_args__ = {'schema': 'DIALECT'}
+        ID = Column(Integer, primary_key=True)
+        CUSTOMER_ID = Column(Integer, ForeignKey(Customer.ID))
+        AMOUNT = Column(Numeric)
+        STATUS = Column(String)
+        customer = relationship(Customer)
+
+    def core_select():
+        return select(orders.c.ID, orders.c.AMOUNT).where(orders.c.ID > 10).where(orders.c.STATUS == 'PAID')
+
+    def core_aggregate():
+        return (select(customers.c.REGION, func.count(), func.sum(orders.c.AMOUNT))
+                .select_from(orders.join(customers, orders.c.CUSTOMER_ID == customers.c.ID))
+                .where(orders.c.ID > 10).group_by(customers.c.REGION).order_by(customers.c.REGION))
+
+    def core_insert():
+        return orders.insert().values(ID=1, CUSTOMER_ID=2, AMOUNT=3, STATUS='NEW')
+
+    def orm_select():
+        return (select(Order).join(Order.customer).where(Customer.REGION == 'R1')
+                .where(Order.AMOUNT > 100).order_by(Order.ID).limit(50))
+
+    return dict(core_select=core_select, core_aggregate=core_aggregate, core_insert=core_insert,
+                orm_select=orm_select)
+
+
+def bench_compile(repeat):
+    from pycalcite.dialect import PyCalciteDialect
+    dialect = PyCalciteDialect()
+    results = {}
+    for name, build in sorted(_statements().items()):
+        per_mode = {}
+        for mode in ('uncached', 'cached'):
+            cache = {} if mode == 'cached' else None
+            samples = []
+            for _ in range(repeat):
+                statement = build()
+                start = time.perf_counter()
+                statement._compile_w_cache(dialect, compiled_cache=cache, column_keys=[])
+                samples.append(time.perf_counter() - start)
+            per_mode[mode] = _summary(samples)
+        per_mode['speedup'] = per_mode['uncached']['median'] / per_mode['cached']['median']
+        results[name] = per_mode
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--output', help='JSON file to write, stdout by default')
+    args = parser.parse_args(argv)
+    import sqlalchemy
+    results = dict(sqlalchemy=sqlalchemy.__version__, repeat=args.repeat,
+                   compile_seconds=bench_compile(args.repeat))
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Deterministic CSV datasets and the Calcite model the benchmarks run on
+
+Every scale gets an ORDERS_<rows> table, joined to one CUSTOMERS table. The
+files are written twice:
+
+* ``typed/`` for ``org.apache.calcite.adapter.csv.CsvSchemaFactory`` of the
+  bundled calcite-example-csv jar, whose ``NAME:type`` headers convert the
+  values (schema CSV);
+* ``dialect/`` for ``com.fawvw.ms.bp.core.dialect.CsvSchemaFactory``, which
+  hands the split line over as is and therefore declares every column
+  ``VARCHAR`` (schema DIALECT).
+"""
+from __future__ import absolute_import
+
+import datetime
+import os
+import random
+
+DEFAULT_SCALES = (1000, 100000, 1000000)
+CUSTOMERS = 1000
+STATUSES = ('NEW', 'PAID', 'SHIPPED', 'RETURNED')
+
+ORDER_COLUMNS = (('ID', 'int'), ('CUSTOMER_ID', 'int'), ('AMOUNT', 'double'),
+                 ('STATUS', 'string'), ('CREATED', 'timestamp'))
+CUSTOMER_COLUMNS = (('ID', 'int'), ('NAME', 'string'), ('REGION', 'string'))
+
+_START = datetime.datetime(2020, 1, 1)
+
+
+def orders_table(rows):
+    return 'ORDERS_%d' % rows
+
+
+def _order_rows(rows, seed):
+    rnd = random.Random(seed + rows)
+    for i in range(rows):
+        # every 50th amount is empty, i.e. NULL for the typed adapter
+        amount = '' if i % 50 == 0 else '%.2f' % rnd.uniform(1, 1000)
+        created = _START + datetime.timedelta(seconds=rnd.randrange(3 * 365 * 86400))
+        yield (str(i), str(rnd.randrange(CUSTOMERS)), amount, rnd.choice(STATUSES),
+               created.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def _customer_rows(seed):
+    rnd = random.Random(seed)
+    for i in range(CUSTOMERS):
+        yield str(i), 'customer %d' % i, 'R%d' % rnd.randrange(10)
+
+
+def _write(path, columns, rows, typed):
+    if os.path.exists(path):
+        return
+    header = ','.join('%s:%s' % (name, kind if typed else 'VARCHAR') for name, kind in columns)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(header + '\n')
+        for row in rows:
+            f.write(','.join(row) + '\n')
+    os.rename(tmp_path, path)
+
+
+def generate(directory, scales=DEFAULT_SCALES, seed=42):
+    """Write the CSV files of ``scales`` under ``directory`` unless they exist already"""
+    for typed, sub_dir in ((True, 'typed'), (False, 'dialect')):
+        path = os.path.join(directory, sub_dir)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        _write(os.path.join(path, 'CUSTOMERS.csv'), CUSTOMER_COLUMNS, _customer_rows(seed), typed)
+        for rows in scales:
+            _write(os.path.join(path, '%s.csv' % orders_table(rows)), ORDER_COLUMNS, _order_rows(rows, seed), typed)
+
+
+def model(directory, scales=DEFAULT_SCALES, lex='MYSQL'):
+    """The con_json_dict of a connection on the datasets of ``directory``"""
+    file_names = ['CUSTOMERS.csv'] + ['%s.csv' % orders_table(rows) for rows in scales]
+    return {
+        'version': '1.0',
+        'defaultSchema': 'CSV',
+        'schemas': [
+            {
+                'name': 'CSV',
+                'type': 'custom',
+                'factory': 'org.apache.calcite.adapter.csv.CsvSchemaFactory',
+                'operand': {'directory': os.path.join(directory, 'typed')},
+            },
+            {
+                'name': 'DIALECT',
+                'type': 'custom',
+                'factory': 'com.fawvw.ms.bp.core.dialect.CsvSchemaFactory',
+                'operand': {'files_dir': os.path.join(directory, 'dialect'), 'file_names': '!'.join(file_names)},
+            },
+        ],
+        'lex': lex,
+    }
@@ -0,0 +1,256 @@
+"""Offline pycalcite benchmarks over generated CSV datasets
+
+Runs without any external database: the datasets are CSV files read by the
+CSV adapters shipped in pycalcite/jar (see datasets.py). Results are written
+as JSON so that runs can be compared::
+
+    python benchmarks/run.py --scales 1000 100000 --output before.json
+    python benchmarks/run.py --scales 1000 100000 --output after.json
+
+JVM start and the first query are measured in fresh interpreters, everything
+else in this process after a warm-up.
+"""
+from __future__ import absolute_import
+
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import datasets  # noqa: E402
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'pycalcite-bench')
+
+SIMPLE_QUERY = 'SELECT ID, AMOUNT, STATUS FROM CSV.%s WHERE ID > ?'
+JOIN_QUERY = ('SELECT c.REGION, COUNT(*), SUM(o.AMOUNT) FROM CSV.%s o JOIN CSV.CUSTOMERS c '
+              'ON o.CUSTOMER_ID = c.ID WHERE o.ID > ? GROUP BY c.REGION ORDER BY c.REGION')
+SCAN_QUERY = 'SELECT * FROM CSV.%s'
+
+
+def _summary(samples):
+    return dict(median=statistics.median(samples), min=min(samples), max=max(samples), runs=len(samples))
+
+
+def _connect(model, **kwargs):
+    from pycalcite.connection import Connection
+    return Connection(con_json_dict=model, use_bridge_pool=False, **kwargs)
+
+
+def cold_start(model):
+    """JVM start, bridge construction and first query in this (fresh) interpreter"""
+    from pycalcite.calcite4py import startup_JVM
+    from pycalcite.jvm import get_JVM_options
+    options = get_JVM_options()
+    start = time.perf_counter()
+    startup_JVM(options.classpath(json.dumps(model)), options.to_args())
+    jvm = time.perf_counter() - start
+    start = time.perf_counter()
+    conn = _connect(model)
+    connect = time.perf_counter() - start
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM CSV.CUSTOMERS')
+    cursor.fetchall()
+    first_query = time.perf_counter() - start
+    conn.close()
+    return dict(jvm_start=jvm, connect=connect, first_query=first_query)
+
+
+def bench_cold_start(args):
+    samples = []
+    for _ in range(args.cold_runs):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--cold-start',
+                                       '--data-dir', args.data_dir, '--scales'] + [str(s) for s in args.scales])
+        samples.append(json.loads(out.decode('utf-8').strip().splitlines()[-1]))
+    return dict((key, _summary([sample[key] for sample in samples])) for key in samples[0])
+
+
+def bench_connect(model, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn = _connect(model)
+        samples.append(time.perf_counter() - start)
+        conn.close()
+    return _summary(samples)
+
+
+def bench_planning(model, scale, repeat):
+    """prepareStatement() time of a simple and a join query, without statement cache"""
+    conn = _connect(model, statement_cache_size=0)
+    table = datasets.orders_table(scale)
+    results = {}
+    try:
+        cursor = conn.cursor()
+        for name, sql in (('simple', SIMPLE_QUERY), ('join', JOIN_QUERY)):
+            samples = []
+            for _ in range(repeat):
+                cursor.execute(sql % table, [scale])  # no rows: measures planning only
+                cursor.fetchall()
+                samples.append(cursor.stats.plan)
+            results[name] = _summary(samples)
+        cursor.close()
+    finally:
+        conn.close()
+    return results
+
+
+def _fetch(cursor, method, arraysize):
+    rows = 0
+    if method == 'fetchone':
+        while cursor.fetchone() is not None:
+            rows += 1
+    elif method == 'fetchmany':
+        while True:
+            chunk = cursor.fetchmany(arraysize)
+            if not chunk:
+                break
+            rows += len(chunk)
+    else:
+        rows = len(cursor.fetchall())
+    return rows
+
+
+def bench_fetch(model, scales, repeat, arraysize):
+    """Rows per second of a full scan through fetchone, fetchmany and fetchall"""
+    conn = _connect(model)
+    results = {}
+    try:
+        cursor = conn.cursor()
+        for scale in scales:
+            per_method = {}
+            for method in ('fetchone', 'fetchmany', 'fetchall'):
+                samples = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    cursor.execute(SCAN_QUERY % datasets.orders_table(scale))
+                    rows = _fetch(cursor, method, arraysize)
+                    samples.append(rows / (time.perf_counter() - start))
+                per_method[method] = _summary(samples)
+            results[str(scale)] = per_method
+        cursor.close()
+    finally:
+        conn.close()
+    return results
+
+
+def bench_memory(model, scale):
+    """Python and JVM heap held by the rows of fetchall(), scaled to 1M rows"""
+    import jpype
+    runtime = jpype.JClass('java.lang.Runtime').getRuntime()
+    conn = _connect(model)
+    try:
+        cursor = conn.cursor()
+        gc.collect()
+        runtime.gc()
+        jvm_before = runtime.totalMemory() - runtime.freeMemory()
+        tracemalloc.start()
+        cursor.execute(SCAN_QUERY % datasets.orders_table(scale))
+        rows = cursor.fetchall()
+        python_bytes, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        jvm_after = runtime.totalMemory() - runtime.freeMemory()
+        factor = 1000000.0 / max(len(rows), 1)
+        del rows
+        cursor.close()
+    finally:
+        conn.close()
+    return dict(rows=scale, python_bytes_per_1m_rows=int(python_bytes * factor),
+                python_peak_bytes_per_1m_rows=int(python_peak * factor),
+                jvm_heap_growth_bytes_per_1m_rows=int((jvm_after - jvm_before) * factor))
+
+
+def bench_reflection(model, repeat):
+    """SQLAlchemy Inspector over both schemas, with the metadata cache dropped (cold) and kept (warm)"""
+    from sqlalchemy import create_engine, inspect
+    from sqlalchemy.dialects import registry
+    registry.register('pycalcite', 'pycalcite.dialect', 'PyCalciteDialect')
+    engine = create_engine('pycalcite://', connect_args=dict(con_json_dict=model, use_bridge_pool=False))
+
+    def reflect():
+        inspector = inspect(engine)
+        for schema in ('CSV', 'DIALECT'):
+            for table in inspector.get_table_names(schema):
+                inspector.get_columns(table, schema)
+
+    results = {}
+    try:
+        for mode in ('cold', 'warm'):
+            samples = []
+            for _ in range(repeat):
+                if mode == 'cold':
+                    engine.dialect.invalidate_metadata()
+                start = time.perf_counter()
+                reflect()
+                samples.append(time.perf_counter() - start)
+            results[mode] = _summary(samples)
+    finally:
+        engine.dispose()
+    return results
+
+
+def _environment():
+    from pycalcite.jvm import get_JVM_options
+    return dict(python=sys.version.split()[0], platform=platform.platform(),
+                jvm_args=get_JVM_options().to_args(), date=datetime.datetime.now().isoformat())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='where the CSV datasets are generated')
+    parser.add_argument('--scales', type=int, nargs='+', default=list(datasets.DEFAULT_SCALES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cold-runs', type=int, default=3)
+    parser.add_argument('--arraysize', type=int, default=1000)
+    parser.add_argument('--only', nargs='+',
+                        choices=('cold_start', 'connect', 'planning', 'fetch', 'memory', 'reflection'))
+    parser.add_argument('--output', help='JSON file to write, stdout by default')
+    parser.add_argument('--cold-start', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    # the pycalcite logger writes debug lines to stdout, keep the JSON clean
+    logging.getLogger('pycalcite').setLevel(logging.WARNING)
+
+    datasets.generate(args.data_dir, args.scales)
+    model = datasets.model(args.data_dir, args.scales)
+    if args.cold_start:
+        print(json.dumps(cold_start(model)))
+        return
+
+    selected = set(args.only or ('cold_start', 'connect', 'planning', 'fetch', 'memory', 'reflection'))
+    results = dict(environment=_environment(), scales=args.scales, repeat=args.repeat)
+    if 'cold_start' in selected:
+        results['cold_start'] = bench_cold_start(args)
+    # warm up the JVM of this process before the in-process benchmarks
+    cold_start(model)
+    if 'connect' in selected:
+        results['connect'] = bench_connect(model, args.repeat)
+    if 'planning' in selected:
+        results['planning'] = bench_planning(model, min(args.scales), args.repeat)
+    if 'fetch' in selected:
+        results['fetch_rows_per_second'] = bench_fetch(model, args.scales, args.repeat, args.arraysize)
+    if 'memory' in selected:
+        results['memory'] = bench_memory(model, max(args.scales))
+    if 'reflection' in selected:
+        results['reflection'] = bench_reflection(model, args.repeat)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
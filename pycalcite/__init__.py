@@ -7,6 +7,8 @@
 from pycalcite.error import Error
 
 VERSION = (0, 0, 1, None)
+# threads may share the module but not connections: a Connection and its
+# cursors must be used by one thread at a time, except Cursor.cancel()
 threadsafety = 1
 apilevel = "2.0"
 paramstyle = "pyformat"
@@ -32,10 +34,11 @@ class DBAPISet(frozenset):
 def Connect(*args, **kwargs):
     """
     Connect to the database; see connections.Connection.__init__() for
-    more information.
+    more information. isolation='process' runs the queries in worker
+    processes, see process.ProcessConnection.
     """
-    from .connection import Connection
-    return Connection(*args, **kwargs)
+    from .connection import connect
+    return connect(*args, **kwargs)
 
 
 def get_client_info():
@@ -44,6 +47,34 @@ def get_client_info():
 
 connect = Connection = Connect
 
+
+def read_dataframe(sql, connection, params=None, chunksize=None):
+    """
+    Read the result of sql into a pandas DataFrame; see
+    columnar.read_dataframe() for more information.
+    """
+    from .columnar import read_dataframe
+    return read_dataframe(sql, connection, params=params, chunksize=chunksize)
+
+
+def execute_many_parallel(queries, max_workers=None, **kwargs):
+    """
+    Run independent queries concurrently, each on its own connection; see
+    parallel.execute_many_parallel() for more information.
+    """
+    from .parallel import execute_many_parallel
+    return execute_many_parallel(queries, max_workers=max_workers, **kwargs)
+
+
+def configure_JVM(options=None, **kwargs):
+    """
+    Set the heap, GC, JIT, classpath and CDS options of the JVM started by
+    the first connection; see jvm.configure_JVM() for more information.
+    """
+    from .jvm import configure_JVM
+    return configure_JVM(options, **kwargs)
+
+
 # we include a doctored version_info here for MySQLdb compatibility
 version_info = (1, 2, 6, "final", 0)
 
@@ -58,7 +89,8 @@ def thread_safe():
 
 __all__ = [
     'BINARY', 'Error', 'Connect', 'Connection',
-    'DBAPISet', 'connect',
+    'DBAPISet', 'connect', 'read_dataframe', 'execute_many_parallel',
+    'configure_JVM',
     'paramstyle', 'threadsafety', 'version_info',
     "NULL", "__version__",
 ]
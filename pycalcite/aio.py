@@ -0,0 +1,157 @@
+from __future__ import absolute_import
+
+import asyncio
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .calcite4py import attach_JVM_thread
+
+DEFAULT_MAX_WORKERS = 32
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=None):
+    """Return the shared JVM-attached thread pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers or DEFAULT_MAX_WORKERS,
+                                           thread_name_prefix='pycalcite-aio',
+                                           initializer=attach_JVM_thread)
+        return _executor
+
+
+def _call(func, *args, **kwargs):
+    # the JVM may have been started after this worker thread was created
+    attach_JVM_thread()
+    return func(*args, **kwargs)
+
+
+async def _run(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(_call, func, *args, **kwargs))
+
+
+async def connect(*args, executor=None, **kwargs):
+    """Open a pycalcite connection whose calls run on a JVM-attached thread pool
+
+    See connection.Connection for the arguments. Cancelling a task awaiting
+    ``execute()`` or a fetch calls ``Statement.cancel()`` on the statement.
+    """
+    from .connection import Connection
+    executor = executor or get_executor()
+    conn = await _run(executor, Connection, *args, **kwargs)
+    return AsyncConnection(conn, executor)
+
+
+class AsyncConnection(object):
+    def __init__(self, conn, executor):
+        self.sync_connection = conn
+        self._executor = executor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def cursor(self, streaming=False, fetch_size=None):
+        """Open a cursor, see connection.Connection.cursor(); it may reopen a stale bridge"""
+        cursor = await _run(self._executor, self.sync_connection.cursor, streaming, fetch_size)
+        return AsyncCursor(cursor, self._executor)
+
+    async def close(self):
+        await _run(self._executor, self.sync_connection.close)
+
+    async def commit(self):
+        await _run(self._executor, self.sync_connection.commit)
+
+    async def rollback(self):
+        await _run(self._executor, self.sync_connection.rollback)
+
+
+class AsyncCursor(object):
+    # rows fetched per pool round trip by ``async for``
+    iter_size = 1000
+
+    def __init__(self, cursor, executor):
+        self.sync_cursor = cursor
+        self._executor = executor
+        self._rows = deque()
+        self._exhausted = False
+
+    @property
+    def description(self):
+        return self.sync_cursor.description
+
+    @property
+    def rowcount(self):
+        return self.sync_cursor.rowcount
+
+    @property
+    def arraysize(self):
+        return self.sync_cursor.arraysize
+
+    @arraysize.setter
+    def arraysize(self, value):
+        self.sync_cursor.arraysize = value
+
+    async def _cancellable(self, func, *args):
+        try:
+            return await _run(self._executor, func, *args)
+        except asyncio.CancelledError:
+            self.sync_cursor.cancel()
+            raise
+
+    async def execute(self, operation, parameters=None, timeout=None):
+        self._rows.clear()
+        self._exhausted = False
+        return await self._cancellable(self.sync_cursor.execute, operation, parameters, timeout)
+
+    async def executemany(self, operation, seq_of_parameters, timeout=None):
+        self._rows.clear()
+        self._exhausted = False
+        return await self._cancellable(self.sync_cursor.executemany, operation, seq_of_parameters, None, timeout)
+
+    async def fetchone(self):
+        if self._rows:
+            return self._rows.popleft()
+        return await self._cancellable(self.sync_cursor.fetchone)
+
+    async def fetchmany(self, size=None):
+        size = size or self.arraysize
+        rows = [self._rows.popleft() for _ in range(min(size, len(self._rows)))]
+        if len(rows) < size:
+            rows.extend(await self._cancellable(self.sync_cursor.fetchmany, size - len(rows)) or [])
+        return rows
+
+    async def fetchall(self):
+        """Fetch the remaining rows like Cursor.fetchall(), a spill.SpilledRows for large results"""
+        # rows read ahead by ``async for`` come first and spill with the rest
+        self.sync_cursor._unread(self._rows)
+        self._rows.clear()
+        return await self._cancellable(self.sync_cursor.fetchall)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._rows and not self._exhausted:
+            size = max(self.iter_size, 1)
+            rows = await self._cancellable(self.sync_cursor.fetchmany, size) or []
+            self._exhausted = len(rows) < size
+            self._rows.extend(rows)
+        if not self._rows:
+            raise StopAsyncIteration
+        return self._rows.popleft()
+
+    async def close(self):
+        self._rows.clear()
+        await _run(self._executor, self.sync_cursor.close)
+
+    def cancel(self):
+        self.sync_cursor.cancel()
@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# put this comment in a query to run it without the result cache
+NO_CACHE_HINT = '/* pycalcite:no_cache */'
+
+_WHITESPACE_RE = re.compile(r"('(?:[^']|'')*')|\s+")
+
+
+def normalize_sql(sql):
+    """Collapse whitespace outside of string literals and drop a trailing semicolon"""
+    sql = _WHITESPACE_RE.sub(lambda m: m.group(1) if m.group(1) is not None else ' ', sql).strip()
+    return sql[:-1].rstrip() if sql.endswith(';') else sql
+
+
+def _freeze(parameters):
+    if not parameters:
+        return ()
+    if isinstance(parameters, dict):
+        return tuple(sorted(parameters.items()))
+    return tuple(parameters)
+
+
+def estimate_size(rows, sample=100):
+    """Roughly estimate the memory held by a list of row tuples from a sample of them"""
+    if not rows:
+        return 0
+    step = max(len(rows) // sample, 1)
+    picked = rows[::step]
+    total = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in picked)
+    return sys.getsizeof(rows) + total * len(rows) // len(picked)
+
+
+class CachedResult(object):
+    """Column metadata and converted rows of a query kept by ResultCache"""
+
+    def __init__(self, columns, rows, update_count=-1):
+        self.columns = columns
+        self.rows = rows
+        self.update_count = update_count
+        self.size = estimate_size(rows)
+
+
+class ResultCache(object):
+    """Bounded LRU cache of query results with a per-entry TTL
+
+    Results are keyed by model fingerprint, normalized SQL and bound
+    parameters. Entries live ``ttl`` seconds, least recently used entries are
+    evicted once the cached rows exceed ``max_bytes`` and results larger than
+    ``max_entry_bytes`` are not cached at all.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=60, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(fingerprint, sql, parameters=None):
+        """Key of a result, None if ``parameters`` hold unhashable values (lists, dicts, ...)"""
+        key = fingerprint, normalize_sql(sql), _freeze(parameters)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        if result.size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, result)
+            self._bytes += result.size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, fingerprint=None):
+        """Drop the results of one model fingerprint, or all of them"""
+        with self._lock:
+            for key in list(self._entries):
+                if fingerprint is None or key[0] == fingerprint:
+                    self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        entries=len(self._entries), bytes=self._bytes)
+
+    def _remove(self, key):
+        # callers hold self._lock
+        self._bytes -= self._entries.pop(key)[1].size
+
+
+# shared by connections opened with result_cache=True
+default_result_cache = ResultCache()
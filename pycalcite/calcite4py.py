@@ -5,14 +5,27 @@ __license__ = 'MIT'
 __author__ = 'xihaoxie'
 
 import os
+import re
 import datetime
+import decimal
+import functools
+import heapq
+import itertools
+import math
 import threading
+import time
+import queue
+from collections import OrderedDict
+from array import array
 
 import jpype
 from .log import logger
+from .cache import CachedResult, NO_CACHE_HINT, estimate_size
+from .profiling import HOOKS, QueryStats, emit
 import gc
 
 apilevel = 2
+# connections and cursors must not be shared between threads, see Cursor
 threadsafety = 1
 paramstyle = 'qmark'
 
@@ -57,21 +70,31 @@ def _get_system_classpath():
     return classpath.split(os.pathsep)
 
 
-def startup_JVM(jar_paths=None):
-    """Only starup once before caller first time to use JDBC4py"""
+def startup_JVM(jar_paths=None, jvm_args=None):
+    """Only starup once before caller first time to use JDBC4py
+
+    ``jvm_args`` are extra JVM flags, see jvm.JVMOptions.
+    """
     if not jar_paths or not isinstance(jar_paths, list):
         jar_paths = []
 
     if not jpype.isJVMStarted():
-        jar_paths.extend(_get_system_classpath())
-        uniq_jar = list(set(jar_paths))
+        jar_paths = jar_paths + _get_system_classpath()
+        # keep the order, jars listed first are searched first
+        uniq_jar = list(OrderedDict.fromkeys(jar_paths))
         class_path = '-Djava.class.path=' + os.pathsep.join(uniq_jar)  # not ; but :
-        jvm_args = [class_path, '-Dfile.encoding=UTF-8']
+        jvm_args = [class_path, '-Dfile.encoding=UTF-8'] + list(jvm_args or ())
         jvm_path = jpype.getDefaultJVMPath()
         logger.debug('jpype.startJVM() with jvm_args=%s, jvm_path=%s' % (jvm_args, jvm_path))
         jpype.startJVM(jvm_path, *jvm_args)
 
-    if not jpype.isThreadAttachedToJVM():
+    attach_JVM_thread()
+
+
+def attach_JVM_thread():
+    """Attach the calling thread to the started JVM, threads other than the one
+    that ran startup_JVM need it before they touch a connection or cursor"""
+    if jpype.isJVMStarted() and not jpype.isThreadAttachedToJVM():
         logger.debug('need to attachThreadToJVM()')
         jpype.attachThreadToJVM()
 
@@ -84,18 +107,382 @@ def stop_JVM():
     gc.collect()
 
 
+# convert SQL types to Python types
+# see https://docs.oracle.com/javase/8/docs/api/java/sql/Types.html
+# and https://docs.oracle.com/javase/8/docs/api/constant-values.html#java.sql.Types.ARRAY
+# and http://www.cnblogs.com/shishm/archive/2012/01/30/2332142.html
+_INTEGER_TYPES = (-6, 5, 4)  # ('TINYINT', 'SMALLINT', 'INTEGER')
+_BIGINT_TYPES = (-5,)  # ('BIGINT',)
+_FLOAT_TYPES = (6, 8, 3, 7, 2)  # ('FLOAT', 'DOUBLE', 'DECIMAL', 'REAL', 'NUMERIC')
+_DECIMAL_TYPES = (3, 2)  # ('DECIMAL', 'NUMERIC')
+_BOOLEAN_TYPES = (-7, 16)  # ('BIT', 'BOOLEAN')
+_STRING_TYPES = (1, 12)  # ('CHAR', 'VARCHAR')
+_TIMESTAMP_TYPES = (93, 2014)  # ('TIMESTAMP', 'TIMESTAMP_WITH_TIMEZONE')
+_TIME_TYPES = (92, 2013)  # ('TIME', 'TIME_WITH_TIMEZONE')
+_DATE_TYPES = (91,)  # ('DATE',)
+_BINARY_TYPES = (-2, -3)  # ('BINARY', 'VARBINARY')
+_NULL_TYPES = (0,)  # ('NULL',)
+_TEMPORAL_TYPES = _TIMESTAMP_TYPES + _TIME_TYPES + _DATE_TYPES
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+# exact scaleb() whatever the number of digits
+_DECIMAL_CONTEXT = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+
+
+def _to_decimal(val):
+    """Build a Decimal from the unscaled value and scale of a java.math.BigDecimal"""
+    unscaled = val.unscaledValue()
+    if unscaled.bitLength() < 64:
+        digits = int(unscaled.longValue())
+    else:
+        digits = int(str(unscaled.toString()))
+    return decimal.Decimal(digits).scaleb(-int(val.scale()), _DECIMAL_CONTEXT)
+
+
+def _to_datetime(val):
+    # java.sql.Timestamp read with a UTC calendar: epoch millis of the wall
+    # clock time, getNanos() holds the whole fraction of the second
+    seconds = int(val.getTime()) // 1000
+    return _EPOCH + datetime.timedelta(0, seconds, int(val.getNanos()) // 1000)
+
+
+def _to_date(val):
+    return datetime.date.fromordinal(_EPOCH_ORDINAL + int(val.getTime()) // 86400000)
+
+
+def _to_time(val):
+    millis = int(val.getTime()) % 86400000
+    seconds, millis = divmod(millis, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    return datetime.time(minutes // 60, minutes % 60, seconds, millis * 1000)
+
+
+def _column_converter(rs, col_type, utc=None):
+    """Return (getter, convert, check_null) for a column of java.sql.Types ``col_type``
+
+    ``getter`` is the bound ResultSet method to call with the column index,
+    ``convert`` turns its non-null result into a Python value (None to keep it
+    as is) and ``check_null`` tells whether ``wasNull()`` must be consulted
+    because the getter returns a primitive. Temporal values are read through
+    the UTC calendar ``utc`` and built from their epoch values, decimals from
+    their unscaled value, without going through strings.
+    """
+    if col_type in _INTEGER_TYPES:
+        return rs.getInt, int, True
+    if col_type in _BIGINT_TYPES:
+        return rs.getLong, int, True
+    if col_type in _DECIMAL_TYPES:
+        return rs.getBigDecimal, _to_decimal, False
+    if col_type in _FLOAT_TYPES:
+        return rs.getDouble, float, True
+    if col_type in _BOOLEAN_TYPES:
+        return rs.getBoolean, bool, True
+    if col_type in _STRING_TYPES:
+        return rs.getString, str, False
+    if col_type in _TEMPORAL_TYPES:
+        utc = utc or _utc_calendar()
+        if col_type in _TIMESTAMP_TYPES:
+            getter, convert = rs.getTimestamp, _to_datetime
+        elif col_type in _DATE_TYPES:
+            getter, convert = rs.getDate, _to_date
+        else:
+            getter, convert = rs.getTime, _to_time
+        return (lambda i: getter(i, utc)), convert, False
+    if col_type in _BINARY_TYPES:
+        return rs.getBytes, bytes, False
+    if col_type in _NULL_TYPES:
+        return rs.getObject, lambda val: 'NULL', False
+    return rs.getString, str, False
+
+
+# column kinds of a ColumnBatch, shared with com.fawvw.ms.bp.core.RowBatchFetcher
+KIND_LONG = 0  # int64
+KIND_DOUBLE = 1  # float64
+KIND_BOOLEAN = 2  # bool
+KIND_STRING = 3  # str
+KIND_TIMESTAMP = 4  # int64 microseconds since epoch
+KIND_DATE = 5  # int64 days since epoch
+KIND_TIME = 6  # int64 microseconds since midnight
+KIND_BYTES = 7  # bytes
+KIND_OBJECT = 8  # str of any other type
+
+_PACKED_KINDS = (KIND_LONG, KIND_DOUBLE, KIND_BOOLEAN, KIND_TIMESTAMP, KIND_DATE, KIND_TIME)
+_ROW_BATCH_FETCHER = 'com.fawvw.ms.bp.core.RowBatchFetcher'
+_row_batch_fetcher = None
+
+
+_TEMPORAL_KINDS = (KIND_TIMESTAMP, KIND_DATE, KIND_TIME)
+
+
+def _native_view(values):
+    """memoryview of a Java primitive array; JPype exports long[] as '=q', which cannot be indexed"""
+    view = memoryview(values)
+    if view.format.startswith('='):
+        view = view.cast('B').cast(view.format[1:])
+    return view
+
+
+def _calendar_getter(getter, utc):
+    return lambda i: getter(i, utc)
+
+
+def _pack_boolean(val):
+    return 1 if val else 0
+
+
+def _pack_timestamp(ts):
+    # java.sql.Timestamp read with the UTC calendar -> microseconds since epoch
+    return (int(ts.getTime()) // 1000) * 1000000 + int(ts.getNanos()) // 1000
+
+
+def _pack_date(d):
+    return int(d.getTime()) // 86400000
+
+
+def _pack_time(t):
+    return int(t.getTime()) % 86400000 * 1000
+
+
+def _column_kind(col_type):
+    if col_type in _INTEGER_TYPES or col_type in _BIGINT_TYPES:
+        return KIND_LONG
+    if col_type in _FLOAT_TYPES:
+        return KIND_DOUBLE
+    if col_type in _BOOLEAN_TYPES:
+        return KIND_BOOLEAN
+    if col_type in _STRING_TYPES:
+        return KIND_STRING
+    if col_type in _TIMESTAMP_TYPES:
+        return KIND_TIMESTAMP
+    if col_type in _DATE_TYPES:
+        return KIND_DATE
+    if col_type in _TIME_TYPES:
+        return KIND_TIME
+    if col_type in _BINARY_TYPES:
+        return KIND_BYTES
+    return KIND_OBJECT
+
+
+def _get_row_batch_fetcher():
+    """Return the RowBatchFetcher class, or None if row_batch_fetcher.jar is not on the classpath"""
+    global _row_batch_fetcher
+    if _row_batch_fetcher is None:
+        try:
+            _row_batch_fetcher = jpype.JClass(_ROW_BATCH_FETCHER)
+        except Exception as ex:
+            logger.debug('%s not available, fetch_batch() falls back to row getters: %s' % (_ROW_BATCH_FETCHER, ex))
+            _row_batch_fetcher = False
+    return _row_batch_fetcher or None
+
+
+def _utc_calendar():
+    calendar = jpype.JClass('java.util.Calendar')
+    time_zone = jpype.JClass('java.util.TimeZone')
+    return calendar.getInstance(time_zone.getTimeZone('UTC'))
+
+
+# marks the cells ColumnBatch.value() has not decoded yet
+_UNDECODED = object()
+
+
+class ColumnBatch(object):
+    """Rows of a result set stored column by column
+
+    Columns of packed kinds (see KIND_*) are memoryviews over primitive
+    arrays, the others are lists; ``nulls[i]`` is a byte mask holding 1 for
+    every NULL cell of column ``i``. value() and the Row views of rows()
+    convert single cells to the values of the row tuples, decoding each cell
+    once.
+    """
+
+    # per column function decoding a non-null cell for value(), None to keep
+    # it as is; _CELL_DECODERS of the kinds by default
+    decoders = None
+    _positions = None
+    # per column list of the cells decoded so far, see value()
+    _decoded = None
+
+    def __init__(self, names, kinds, columns, nulls, num_rows):
+        self.names = names
+        self.kinds = kinds
+        self.columns = columns
+        self.nulls = nulls
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, key):
+        if not isinstance(key, int):
+            key = self.names.index(key)
+        return self.columns[key]
+
+    def value(self, column, row):
+        """Python value of the cell of column index ``column`` in ``row``, as the row tuples hold it"""
+        if self.nulls[column][row]:
+            return None
+        decoders = self.decoders
+        if decoders is None:
+            decoders = self.decoders = [_CELL_DECODERS.get(kind) for kind in self.kinds]
+        decode = decoders[column]
+        if decode is None:
+            return self.columns[column][row]
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._decoded = [None] * len(self.columns)
+        cells = decoded[column]
+        if cells is None:
+            cells = decoded[column] = [_UNDECODED] * self.num_rows
+        value = cells[row]
+        if value is _UNDECODED:
+            value = cells[row] = decode(self.columns[column][row])
+        return value
+
+    def position(self, name):
+        """Index of the column ``name``, the first one if several share it"""
+        if self._positions is None:
+            self._positions = dict((column, i) for i, column in reversed(list(enumerate(self.names))))
+        return self._positions[name]
+
+    def rows(self):
+        """A Row view of every row of the batch"""
+        return [Row(self, index) for index in range(self.num_rows)]
+
+
+def _from_micros(value):
+    return _EPOCH + datetime.timedelta(0, 0, value)
+
+
+def _from_days(value):
+    return datetime.date.fromordinal(_EPOCH_ORDINAL + value)
+
+
+def _from_time_micros(value):
+    seconds, micros = divmod(value, 1000000)
+    minutes, seconds = divmod(seconds, 60)
+    return datetime.time(minutes // 60, minutes % 60, seconds, micros)
+
+
+# decode a non-null ColumnBatch cell of each kind, the others are kept as is
+_CELL_DECODERS = {
+    KIND_BOOLEAN: bool,
+    KIND_TIMESTAMP: _from_micros,
+    KIND_DATE: _from_days,
+    KIND_TIME: _from_time_micros,
+}
+
+
+class Row(object):
+    """Row of a ColumnBatch converting a cell only when it is read
+
+    Reads like the row tuples (``row[0]``, slices, unpacking, ``==`` with a
+    tuple) and by column name, ``row['NAME']`` or ``row.NAME``. A row keeps
+    its whole batch alive, tuple(row) makes a standalone copy.
+    """
+    __slots__ = ('_batch', '_index')
+
+    def __init__(self, batch, index):
+        self._batch = batch
+        self._index = index
+
+    def __len__(self):
+        return len(self._batch.columns)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return tuple(self[i] for i in range(*key.indices(len(self))))
+        if isinstance(key, str):
+            key = self._batch.position(key)
+        else:
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('row index out of range')
+        return self._batch.value(key, self._index)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._batch.value(self._batch.position(name), self._index)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        batch = self._batch
+        index = self._index
+        for column in range(len(batch.columns)):
+            yield batch.value(column, index)
+
+    def keys(self):
+        return list(self._batch.names)
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            other = tuple(other)
+        return tuple(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        # pickled, e.g. to another process, as the plain tuple
+        return tuple, (tuple(self),)
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+
+def _pack_value(kind, value):
+    """Turn a converted row value back into the packed ColumnBatch representation"""
+    if kind == KIND_TIMESTAMP:
+        delta = value - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    if kind == KIND_DATE:
+        return value.toordinal() - _EPOCH_ORDINAL
+    if kind == KIND_TIME:
+        return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+    if kind == KIND_DOUBLE:
+        return float(value)
+    return int(value)
+
+
+def _rows_to_batch(names, kinds, rows):
+    """Build a ColumnBatch from rows already converted by the cursor"""
+    columns = []
+    nulls = []
+    for i, kind in enumerate(kinds):
+        values = [row[i] for row in rows]
+        nulls.append(memoryview(bytearray(1 if value is None else 0 for value in values)))
+        if kind in _PACKED_KINDS:
+            packed = [0 if value is None else _pack_value(kind, value) for value in values]
+            if kind == KIND_BOOLEAN:
+                columns.append(memoryview(bytearray(packed)))
+            else:
+                columns.append(memoryview(array('d' if kind == KIND_DOUBLE else 'q', packed)))
+        else:
+            columns.append(values)
+    return ColumnBatch(names, kinds, columns, nulls, len(rows))
+
+
 class Calcite4py(object):
     """thread safe JDBC connection"""
     _lock = threading.RLock()
 
-    def __init__(self, jar_paths=None, json_str='', lex='MYSQL'):
+    def __init__(self, jar_paths=None, json_str='', lex='MYSQL', jvm_args=None):
         self._json_str = json_str
         self._jar_paths = jar_paths
         self._lex = lex
+        self._jvm_args = jvm_args
 
     def connect(self):
         with Calcite4py._lock:
-            startup_JVM(self._jar_paths)
+            startup_JVM(self._jar_paths, self._jvm_args)
         try:
             calcite_bridge = jpype.JClass('com.fawvw.ms.bp.core.CalciteBridge')
             conn = calcite_bridge(self._json_str, self._lex)
@@ -110,17 +497,318 @@ class Calcite4py(object):
             raise DatabaseError(msg)
 
 
+# text copied as is: string literals, "quoted" and `MYSQL lex` identifiers,
+# line and block comments; then the placeholders and escaped percent signs
+_PLACEHOLDER_RE = re.compile(
+    r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`(?:[^`]|``)*`|--[^\n]*|/\*.*?\*/)"""
+    r"|%\((\w+)\)s|(%s)|(\?)|(%%)",
+    re.DOTALL)
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_placeholders(operation):
+    """Rewrite pyformat/format/qmark placeholders of ``operation`` to JDBC ``?``
+
+    Returns ``(sql, names)`` where ``names`` lists the pyformat names in
+    order (None for positional placeholders), or None if ``operation`` has
+    no placeholder.
+    """
+    names = []
+
+    def replace(match):
+        quoted, name, format_mark, qmark, percent = match.groups()
+        if quoted is not None:
+            return quoted.replace('%%', '%')
+        if percent is not None:
+            return '%'
+        names.append(name)
+        return '?'
+
+    sql = _PLACEHOLDER_RE.sub(replace, operation)
+    if not names:
+        return None
+    return sql, tuple(names)
+
+
+def _bind_parameters(stmt, values):
+    for i, value in enumerate(values, 1):
+        if value is None:
+            stmt.setNull(i, 0)  # java.sql.Types.NULL
+        elif isinstance(value, bool):
+            stmt.setBoolean(i, value)
+        elif isinstance(value, int):
+            stmt.setLong(i, value)
+        elif isinstance(value, float):
+            stmt.setDouble(i, value)
+        elif isinstance(value, decimal.Decimal):
+            stmt.setBigDecimal(i, jpype.JClass('java.math.BigDecimal')(str(value)))
+        elif isinstance(value, datetime.datetime):
+            stmt.setTimestamp(i, jpype.JClass('java.sql.Timestamp').valueOf(value.strftime('%Y-%m-%d %H:%M:%S.%f')))
+        elif isinstance(value, datetime.date):
+            stmt.setDate(i, jpype.JClass('java.sql.Date').valueOf(value.isoformat()))
+        elif isinstance(value, datetime.time):
+            time_value = jpype.JClass('java.sql.Time').valueOf(value.strftime('%H:%M:%S'))
+            # valueOf() takes whole seconds, java.sql.Time holds milliseconds
+            time_value.setTime(time_value.getTime() + value.microsecond // 1000)
+            stmt.setTime(i, time_value)
+        elif isinstance(value, (bytes, bytearray)):
+            stmt.setBytes(i, jpype.JArray(jpype.JByte)(value))
+        else:
+            stmt.setString(i, str(value))
+
+
+def _parameter_values(operation, names, parameters):
+    """Order the values of one parameter set like the placeholders ``names`` of ``operation``"""
+    if isinstance(parameters, dict):
+        try:
+            return [parameters[name] for name in names]
+        except (KeyError, TypeError):
+            raise ProgrammingError('Mixed or missing parameters for: %s' % operation)
+    values = list(parameters)
+    if len(values) != len(names):
+        raise ProgrammingError('%d parameters given for %d placeholders' % (len(values), len(names)))
+    return values
+
+
+# rows read at a time into the result cache, see Cursor._fill_result_cache()
+_CACHE_FILL_ROWS = 1000
+
+
+class StatementCache(object):
+    """LRU cache of PreparedStatement keyed by SQL text for one connection
+
+    Calcite parses, validates, plans and generates code in prepareStatement(),
+    so executing a cached statement with new parameters skips all of it. A
+    statement is checked out while a cursor uses it, so that two cursors never
+    share one, and statements pushed out beyond ``size`` are closed.
+    """
+
+    def __init__(self, connection_factory, size=64):
+        self._connection_factory = connection_factory
+        self.size = size
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def checkout(self, sql):
+        with self._lock:
+            stmt = self._statements.pop(sql, None)
+            if stmt is not None:
+                self.hits += 1
+                return stmt
+            self.misses += 1
+        return self._connection_factory().prepareStatement(sql)
+
+    def checkin(self, sql, stmt):
+        stmt.clearParameters()
+        with self._lock:
+            if sql in self._statements or self.size <= 0:
+                evicted = [stmt]
+            else:
+                self._statements[sql] = stmt
+                evicted = []
+                while len(self._statements) > self.size:
+                    evicted.append(self._statements.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+
+    def clear(self):
+        with self._lock:
+            statements = list(self._statements.values())
+            self._statements.clear()
+        for stmt in statements:
+            try:
+                stmt.close()
+            except Exception as ex:
+                logger.debug('closing cached statement failed: %s' % ex)
+
+
+class _RowPrefetcher(threading.Thread):
+    """Fetch and convert the next rows of a cursor on a JVM-attached thread
+
+    Chunks of ``size`` rows go through a queue bounded by ``depth``, an empty
+    chunk marks the end of the result set and an exception raised while
+    fetching is handed over as the last item.
+    """
+
+    def __init__(self, cursor, size, depth):
+        super(_RowPrefetcher, self).__init__(name='pycalcite-prefetch')
+        self.daemon = True
+        self._cursor = cursor
+        self._size = size
+        self._queue = queue.Queue(maxsize=depth)
+        self._stopped = threading.Event()
+
+    def run(self):
+        attach_JVM_thread()
+        try:
+            while not self._stopped.is_set():
+                rows = self._cursor._fetch_rows(self._size)
+                self._put(rows)
+                if len(rows) < self._size:
+                    if rows:
+                        self._put([])
+                    break
+        except Exception as ex:
+            self._put(ex)
+        finally:
+            self._cursor = None
+            jpype.detachThreadFromJVM()
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self):
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def stop(self):
+        self._stopped.set()
+        while self.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.join()
+
+
+class _Watchdog(object):
+    """One daemon thread calling the callbacks of expired statement timeouts
+
+    arm() costs a heap push under a lock, so statements with a timeout do not
+    start a thread each; disarmed entries are dropped once they reach the top
+    of the heap.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._thread = None
+
+    def arm(self, timeout, callback):
+        """Call ``callback()`` in ``timeout`` seconds unless the returned entry is disarmed first"""
+        entry = [time.monotonic() + timeout, next(self._seq), callback]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='pycalcite-watchdog')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def disarm(self, entry):
+        if entry is not None:
+            entry[2] = None
+
+    def _next_expired(self):
+        with self._cond:
+            while True:
+                heap = self._heap
+                while heap and heap[0][2] is None:
+                    heapq.heappop(heap)
+                if not heap:
+                    self._cond.wait()
+                    continue
+                delay = heap[0][0] - time.monotonic()
+                if delay <= 0:
+                    entry = heapq.heappop(heap)
+                    callback, entry[2] = entry[2], None
+                    return callback
+                self._cond.wait(delay)
+
+    def _run(self):
+        while True:
+            callback = self._next_expired()
+            try:
+                callback()
+            except Exception as ex:
+                logger.debug('statement timeout callback failed: %s' % ex)
+
+
+# cancels the statements of every cursor whose timeout or deadline expired
+watchdog = _Watchdog()
+
+
 class Cursor(object):
+    """DB-API cursor over a CalciteBridge
+
+    A cursor is not thread safe: use it from one thread at a time, like the
+    Connection it belongs to. cancel() is the exception and may be called
+    from any thread. Run independent queries in parallel on separate
+    connections, see pycalcite.execute_many_parallel().
+
+    A statement runs for at most ``timeout`` seconds (the connection's
+    ``query_timeout`` by default) and must finish by ``deadline``, a
+    time.time() value; either way it is cancelled and execute() raises
+    OperationalError.
+    """
     arraysize = 1
     rowcount = -1
+    # parameter sets sent per executeBatch() by executemany()
+    executemany_batch_size = 1000
+    # update counts of each executeBatch() of the last executemany()
+    batch_rowcounts = None
+    # chunks of arraysize rows fetched ahead while the cursor is iterated
+    prefetch_depth = 2
+    # rows per round trip set on the statement before it executes, None for
+    # the driver default
+    fetch_size = None
     _stmt = None
     _rs = None
     _rs_meta = None
+    # (name, type name, java.sql.Types code, nullable) of the result columns
+    _columns = None
+    _converters = None
+    # rows served instead of _rs for results taken from the result cache
+    _buffer = None
+    _buffer_pos = 0
+    _batch_fetcher = None
+    _prefetcher = None
+    # SQL text the current statement is cached under, None if not prepared
+    _stmt_sql = None
+    # QueryStats of the last statement, see profiling.register_hook()
+    stats = None
+    # seconds a statement may run, None for the connection's query_timeout
+    timeout = None
+    # time.time() by which every statement must be done, None for no deadline
+    deadline = None
+    _cancelled = False
+    _timed_out = False
+    _timeout = None
+    # bytes of rows fetchall() keeps in memory before spilling the result to
+    # a temp file in spill_dir, None for the connection's spill_threshold
+    spill_threshold = None
+    spill_dir = None
+    # rows fetched, and decoded again from the spill file, at a time
+    spill_chunk_rows = 10000
+    # fetch rows as Row views converting their cells on access rather than
+    # as tuples, None for the connection's lazy_rows; see _read_lazy_rows()
+    lazy_rows = None
+    # rows per ColumnBatch behind the Row views; fetchone() and fetchmany()
+    # serve the rows of a batch before the next one is drained
+    lazy_batch_rows = 10000
+    # (kinds, decoders) of the Row batches of the current result
+    _lazy_layout = None
+    _batch_fetcher_kinds = None
+    # (kinds, readers) of _drain_python_batch() for the current result
+    _batch_readers = None
 
     def __init__(self, conn):
         self._conn = conn
         self._closed = False
         self._description = None
+        # serializes cancel() with the statement hand-over in _close_last()
+        self._cancel_lock = threading.Lock()
 
     def __del__(self):
         self.close()
@@ -129,19 +817,59 @@ class Cursor(object):
     def description(self):
         # [column, None, None, 0, None, 0, True]
         if not self._description:
-            self._description = zip(self.columnnames(), self.columntypenames())
+            self._description = list(zip(self.columnnames(), self.columntypenames()))
         return self._description
 
+    def __iter__(self):
+        """Iterate over the remaining rows, fetching the next chunks in the background
+
+        A worker thread attached to the JVM keeps up to ``prefetch_depth``
+        chunks of ``arraysize`` rows ready while the caller consumes the
+        current one; errors raised while fetching are re-raised here. Do not
+        call the fetch methods while an iteration is in progress.
+        """
+        if not self._has_result():
+            return
+        if self._buffer is not None:
+            # rows are already in memory, nothing to fetch ahead
+            for row in self._fetch_rows(len(self._buffer) - self._buffer_pos):
+                yield row
+            if self._rs is None:
+                return
+            # rows read ahead of a result set, stream the rest
+            self._buffer = None
+        self._stop_prefetch()
+        prefetcher = _RowPrefetcher(self, max(self.arraysize, 1), max(self.prefetch_depth, 1))
+        self._prefetcher = prefetcher
+        prefetcher.start()
+        try:
+            while True:
+                rows = prefetcher.get()
+                if not rows:
+                    return
+                for row in rows:
+                    yield row
+        finally:
+            if self._prefetcher is prefetcher:
+                self._stop_prefetch()
+
+    def _stop_prefetch(self):
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+            self._prefetcher = None
+
     def close(self):
         if self._closed:
             return
-        if self._stmt:
-            self._stmt.close()
-        if self._rs:
-            self._rs.close()
-        self._stmt = None
-        self._rs = None
+        self._stop_prefetch()
+        self._close_last()
+        self._report_complete()
         self._rs_meta = None
+        self._columns = None
+        self._converters = None
+        self._batch_fetcher = None
+        self._batch_readers = None
+        self._lazy_layout = None
         self._description = None
         self._conn = None
         self._closed = True
@@ -152,178 +880,638 @@ class Cursor(object):
         formated = operation.format(*parameters)
         return formated
 
-    def execute(self, operation, parameters=None):
+    def _close_last(self, discard=False):
+        """Close the result set and give the statement back to the cache or close it
+
+        Cancelled statements and, with ``discard``, those of a failed
+        execution are closed rather than cached.
+        """
+        with self._cancel_lock:
+            rs, stmt, sql = self._rs, self._stmt, self._stmt_sql
+            self._rs = None
+            self._stmt = None
+            self._stmt_sql = None
+        self._buffer = None
+        if rs:
+            rs.close()
+        if stmt:
+            if sql is not None and not (discard or self._cancelled or self._conn._closed):
+                self._conn.statement_cache.checkin(sql, stmt)
+            else:
+                stmt.close()
+
+    def _statement_timeout(self, timeout):
+        """Seconds the next statement may run for, from ``timeout``, the cursor, the connection and the deadline"""
+        timeout = timeout or self.timeout or getattr(self._conn, 'query_timeout', None)
+        if self.deadline is not None:
+            remaining = self.deadline - time.time()
+            if remaining <= 0:
+                raise OperationalError('Deadline exceeded before the statement started')
+            timeout = min(timeout, remaining) if timeout else remaining
+        return timeout
+
+    def _arm_timeout(self, timeout, start=True):
+        """Reset the cancellation state and, if ``start``, start the watchdog of the next statement"""
+        self._timeout = timeout = self._statement_timeout(timeout)
+        self._cancelled = False
+        self._timed_out = False
+        if not (timeout and start):
+            return None
+        return watchdog.arm(timeout, functools.partial(self._expire, self.stats))
+
+    def _set_query_timeout(self, stmt):
+        # JDBC takes whole seconds, 0 for none; the watchdog enforces fractions
+        stmt.setQueryTimeout(int(math.ceil(self._timeout)) if self._timeout else 0)
+        # cancel() may have come before the statement was handed to the cursor
+        self._raise_if_cancelled()
+
+    def _expire(self, stats):
+        with self._cancel_lock:
+            if self.stats is not stats:
+                # the statement finished, the cursor runs another one
+                return
+            self._timed_out = True
+            self._cancel()
+
+    def _raise_if_cancelled(self):
+        """Release the statement and raise OperationalError if it was cancelled or timed out"""
+        if not self._cancelled:
+            return
+        self._close_last()
+        sql = self.stats.sql if self.stats is not None else ''
+        if self._timed_out:
+            raise OperationalError('Statement timed out after %.3gs: %s' % (self._timeout, sql))
+        raise OperationalError('Statement was cancelled: %s' % sql)
+
+    def _report_complete(self):
+        stats = self.stats
+        if HOOKS and stats is not None and not stats.reported:
+            stats.reported = True
+            emit('complete', self, stats)
+
+    def _has_result(self):
+        return self._rs is not None or self._buffer is not None
+
+    def _unread(self, rows):
+        """Put ``rows`` fetched earlier back in front of the rows still to fetch
+
+        They go through the read-ahead buffer, so fetchall() still spills,
+        and are not counted twice in the statement's QueryStats.
+        """
+        if not rows:
+            return
+        if self.stats is not None:
+            self.stats.rows -= len(rows)
+        rows = list(rows)
+        if self._buffer is not None:
+            rows.extend(self._buffer[self._buffer_pos:])
+        self._buffer = rows
+        self._buffer_pos = 0
+
+    def _lazy_rows(self):
+        if self.lazy_rows is not None:
+            return self.lazy_rows
+        return getattr(self._conn, 'lazy_rows', False)
+
+    def _result_cache(self, operation):
+        cache = getattr(self._conn, 'result_cache', None)
+        # caching would convert every cell the Row views leave alone
+        if not cache or NO_CACHE_HINT in operation or self._lazy_rows():
+            return None
+        return cache
+
+    def _set_cached_result(self, cached):
+        self._description = None
+        self._rs_meta = None
+        self._converters = None
+        self._batch_fetcher = None
+        self._batch_readers = None
+        self._lazy_layout = None
+        self._columns = cached.columns
+        self._buffer = cached.rows
+        self._buffer_pos = 0
+
+    def _prepare(self, operation, parameters):
+        """Check out a cached PreparedStatement for ``operation`` and bind ``parameters``
+
+        Returns False if ``operation`` has no placeholder.
+        """
+        parsed = _parse_placeholders(operation)
+        if parsed is None:
+            return False
+        sql, names = parsed
+        values = _parameter_values(operation, names, parameters)
+        start = time.perf_counter()
+        self._stmt = self._conn.statement_cache.checkout(sql)
+        self._stmt_sql = sql
+        bind_start = time.perf_counter()
+        _bind_parameters(self._stmt, values)
+        self.stats.plan = bind_start - start
+        self.stats.statement = time.perf_counter() - bind_start
+        return True
+
+    def execute(self, operation, parameters=None, timeout=None):
+        """Run ``operation``, cancelling it after ``timeout`` seconds (see the class docstring)"""
         if self._conn._closed:
             raise DatabaseError('Connection has been closed')
-        if not parameters:
-            parameters = ()
-        operation = self._format_stmt_paras(operation, parameters)
-        self._stmt = self._conn.conn.createStatement()
-        # self._stmt.setQueryTimeout(30)
-        '''
+        self._stop_prefetch()
+        self._close_last()
+        self._report_complete()
+        stats = self.stats = QueryStats(operation)
+        entry = self._arm_timeout(timeout)
         try:
+            return self._execute(operation, parameters, stats)
+        except Exception:
+            self._raise_if_cancelled()
+            self._close_last(discard=True)
+            raise
+        finally:
+            watchdog.disarm(entry)
+
+    def _execute(self, operation, parameters, stats):
+        attach_JVM_thread()
+        stats.attach = time.perf_counter() - stats.started
+        cache = self._result_cache(operation)
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(self._conn.fingerprint, operation, parameters)
+        if cache_key is None:
+            # no cache, or parameters that cannot be part of a key
+            cache = None
+        else:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.debug('result cache hit')
+                self._set_cached_result(cached)
+                stats.cache_hit = True
+                if HOOKS:
+                    emit('execute', self, stats)
+                return cached.update_count
+        if parameters and self._prepare(operation, parameters):
+            logger.debug('begin execute prepared')
+            start = time.perf_counter()
+            # cached statements keep the fetch size and timeout of their previous cursor
+            self._stmt.setFetchSize(self.fetch_size or 0)
+            self._set_query_timeout(self._stmt)
+            flag = self._stmt.execute()
+        else:
+            # statements without placeholders keep the str.format substitution
+            operation = self._format_stmt_paras(operation, parameters or ())
+            start = time.perf_counter()
+            self._stmt = self._conn.conn.createStatement()
+            if self._timeout or self._cancelled:
+                self._set_query_timeout(self._stmt)
+            if self.fetch_size:
+                self._stmt.setFetchSize(self.fetch_size)
             logger.debug('begin execute')
-            # self._rs = self._stmt.executeQuery(operation)
+            stats.statement = time.perf_counter() - start
+            start = time.perf_counter()
             flag = self._stmt.execute(operation)
-            update_count = self._stmt.getUpdateCount()
-            self._rs = self._stmt.getResultSet()
-            if self._rs:
-                self._rs_meta = self._rs.getMetaData()
-            logger.debug('flag=%s, updatecount=%s', flag, update_count)
-            return update_count
-        except jpype.JException(jpype.java.sql.SQLException) as ex:
-            msg = 'SQLException -> execute() error: %s' % ex.message()
-            logger.error(msg)
-            raise DatabaseError(msg)
-        except Exception as ex:
-            logger.error(ex)
-            raise ex
-        '''
-        logger.debug('begin execute')
-        # self._rs = self._stmt.executeQuery(operation)
-        flag = self._stmt.execute(operation)
         update_count = self._stmt.getUpdateCount()
-        self._rs = self._stmt.getResultSet()
-        if self._rs:
-            self._rs_meta = self._rs.getMetaData()
+        self._set_result_set(self._stmt.getResultSet())
+        stats.execute = time.perf_counter() - start
         logger.debug('flag=%s, updatecount=%s', flag, update_count)
+        if HOOKS:
+            emit('execute', self, stats)
+        if self._rs is None:
+            # DML and DDL may change the tables behind cached results
+            self._invalidate_result_cache()
+        elif cache is not None:
+            self._fill_result_cache(cache, cache_key, update_count)
         return update_count
 
-    def executemany(self, operation, seq_of_parameters):
+    def _fill_result_cache(self, cache, key, update_count):
+        """Read the whole result into ``cache``, or stream it uncached once it outgrows max_entry_bytes
+
+        The rows read before the result grew too large are served from
+        memory and the rest straight from the result set, so large results
+        keep their bounded fetching and spilling.
+        """
+        # rows are counted once they are served from the buffer
+        start = time.perf_counter()
+        rows = []
+        while True:
+            chunk = self._read_rows(_CACHE_FILL_ROWS)
+            rows.extend(chunk)
+            if len(chunk) < _CACHE_FILL_ROWS:
+                break
+            if estimate_size(rows) > cache.max_entry_bytes:
+                logger.debug('result larger than max_entry_bytes, streaming it uncached')
+                self.stats.fetch += time.perf_counter() - start
+                self._buffer = rows
+                self._buffer_pos = 0
+                return
+        self.stats.fetch += time.perf_counter() - start
+        cached = CachedResult(self._columns, rows, update_count)
+        cache.put(key, cached)
+        self._close_last()
+        self._set_cached_result(cached)
+
+    def _invalidate_result_cache(self):
+        cache = getattr(self._conn, 'result_cache', None)
+        if cache is not None:
+            cache.invalidate(self._conn.fingerprint)
+
+    def _set_result_set(self, rs):
+        """Keep ``rs`` and precompile one converter per column from its metadata"""
+        self._rs = rs
+        self._description = None
+        self._batch_fetcher = None
+        self._batch_readers = None
+        self._lazy_layout = None
+        if not rs:
+            self._rs_meta = None
+            self._columns = None
+            self._converters = None
+            return
+        if self.fetch_size:
+            rs.setFetchSize(self.fetch_size)
+        meta = self._rs_meta = rs.getMetaData()
+        # ResultSetMetaData.columnNoNulls is 0
+        self._columns = [
+            (str(meta.getColumnName(i)), str(meta.getColumnTypeName(i)), int(meta.getColumnType(i)),
+             meta.isNullable(i) != 0)
+            for i in range(1, meta.getColumnCount() + 1)
+        ]
+        utc = _utc_calendar() if any(column[2] in _TEMPORAL_TYPES for column in self._columns) else None
+        self._converters = [
+            (i,) + _column_converter(rs, column[2], utc)
+            for i, column in enumerate(self._columns, 1)
+        ]
+
+    def executemany(self, operation, seq_of_parameters, batch_size=None, timeout=None):
+        """Execute ``operation`` once per parameter set, ``batch_size`` sets per round trip
+
+        ``seq_of_parameters`` is a sequence of sequences or dicts, or columnar
+        input: a dict of columns, a NumPy 2-D or structured array, a pandas
+        DataFrame or a pyarrow Table/RecordBatch (see
+        columnar.parameter_rows). The parameter sets are bound to one cached
+        PreparedStatement and sent with addBatch()/executeBatch();
+        ``batch_rowcounts`` holds the update count of every batch and
+        ``rowcount`` their total, -1 if the driver did not report it.
+        ``timeout`` bounds all the batches together.
+        """
+        if self._conn._closed:
+            raise DatabaseError('Connection has been closed')
+        from .columnar import parameter_rows
+        self._stop_prefetch()
         self._close_last()
-        self._stmt = self._conn.conn.createStatement()
-        # self._stmt.setQueryTimeout(60)
+        self._report_complete()
+        stats = self.stats = QueryStats(operation)
+        attach_JVM_thread()
+        stats.attach = time.perf_counter() - stats.started
+        batch_size = max(int(batch_size or self.executemany_batch_size), 1)
+        parsed = _parse_placeholders(operation)
+        names = parsed[1] if parsed is not None else None
+        rows = parameter_rows(seq_of_parameters, names)
+        self.batch_rowcounts = []
+        entry = self._arm_timeout(timeout)
         try:
-            for para in seq_of_parameters:
-                operation = self._format_stmt_paras(para)
-                self._stmt.addBatch(operation)
-            update_count = self._stmt.executeBatch()
-            self.rowcount = update_count
-            self._rs = self._stmt.getResultSet()
-            self._rs_meta = self._rs.getMetaData()
+            start = time.perf_counter()
+            if parsed is not None:
+                self._stmt = self._conn.statement_cache.checkout(parsed[0])
+                self._stmt_sql = parsed[0]
+                stats.plan = time.perf_counter() - start
+            else:
+                # statements without placeholders keep the str.format substitution
+                self._stmt = self._conn.conn.createStatement()
+            self._set_query_timeout(self._stmt)
+            stats.statement = time.perf_counter() - start
+            start = time.perf_counter()
+            pending = 0
+            for row in rows:
+                if parsed is not None:
+                    _bind_parameters(self._stmt, _parameter_values(operation, names, row))
+                    self._stmt.addBatch()
+                else:
+                    self._stmt.addBatch(self._format_stmt_paras(operation, row))
+                pending += 1
+                if pending == batch_size:
+                    self._execute_batch()
+                    pending = 0
+            if pending:
+                self._execute_batch()
         except jpype.JException(jpype.java.sql.SQLException) as ex:
-            msg = 'SQLException -> executemany() error: %s' % ex.message()
+            self._raise_if_cancelled()
+            self._close_last(discard=True)
+            msg = 'SQLException -> executemany() error after %d batches: %s' % (len(self.batch_rowcounts), ex.message())
             logger.error(msg)
             raise DatabaseError(msg)
-        except Exception as ex:
-            logger.error(ex)
-            raise ex
+        except Exception:
+            self._raise_if_cancelled()
+            self._close_last(discard=True)
+            raise
+        finally:
+            watchdog.disarm(entry)
+        stats.execute = time.perf_counter() - start
+        self._set_result_set(None)
+        counts = self.batch_rowcounts
+        self.rowcount = -1 if any(count < 0 for count in counts) else sum(counts)
+        # the written tables may back cached results
+        self._invalidate_result_cache()
+        if HOOKS:
+            emit('execute', self, stats)
+        return self.rowcount
+
+    def _execute_batch(self):
+        # Statement.SUCCESS_NO_INFO (-2) and EXECUTE_FAILED (-3) make the batch count unknown
+        counts = [int(count) for count in self._stmt.executeBatch()]
+        self.batch_rowcounts.append(-1 if any(count < 0 for count in counts) else sum(counts))
 
     def fetchone(self):
-        if not self._rs:
+        if not self._has_result():
             # raise DataError('Not result set')
             return None
-        if not self._rs.next(): return None
-        row = []
-        for i in range(1, self._rs_meta.getColumnCount() + 1):
-            # convert SQL types to Python types
-            # see https://docs.oracle.com/javase/8/docs/api/java/sql/Types.html
-            # and https://docs.oracle.com/javase/8/docs/api/constant-values.html#java.sql.Types.ARRAY
-            # and http://www.cnblogs.com/shishm/archive/2012/01/30/2332142.html
-            col = None
-            typename = self._rs_meta.getColumnTypeName(i)
-            col_type = self._rs_meta.getColumnType(i)
-            obj_val = self._rs.getObject(i)
-            if obj_val is None:
-                row.append(None)
-            else:
-                if col_type in (-6, 5, 4):  # ('TINYINT', 'SMALLINT', 'INTEGER')
-                    val = self._rs.getInt(i)
-                    col = int(val) if obj_val is not None else None
+        rows = self._fetch_rows(1)
+        return rows[0] if rows else None
 
-                elif col_type == -5:  # 'BIGINT'
-                    val = self._rs.getLong(i)
-                    col = int(val) if obj_val is not None else None
+    def fetchmany(self, size=None):
+        if not self._has_result():
+            # raise DataError('Not result set')
+            return None
+        if not size:
+            size = self.arraysize
+        return self._fetch_rows(size)
 
-                elif col_type in (6, 8, 3, 7, 2):  # ('FLOAT', 'DOUBLE', 'DECIMAL', 'REAL', 'NUMERIC')
-                    val = self._rs.getFloat(i)
-                    col = float(val) if obj_val is not None else None
+    def fetchall(self):
+        """Fetch all remaining rows as a list, or a spill.SpilledRows beyond ``spill_threshold`` bytes"""
+        if not self._has_result():
+            return []
+        threshold = self.spill_threshold or getattr(self._conn, 'spill_threshold', None)
+        if threshold and self._rs is not None:
+            return self._fetch_spilling(threshold)
+        return self._fetch_rows()
 
-                elif col_type in (-7, 16):  # ('BIT', 'BOOLEAN')
-                    col = bool(self._rs.getBoolean(i))
+    def _fetch_spilling(self, threshold):
+        """fetchall() moving the rows to a SpillFile once they pass ``threshold`` bytes"""
+        from .spill import SpillFile
+        size = max(self.spill_chunk_rows, 1)
+        rows = []
+        spill = None
+        try:
+            while True:
+                chunk = self._fetch_rows(size)
+                if spill is not None:
+                    spill.append(chunk)
+                else:
+                    rows.extend(chunk)
+                    # the size of a row is estimated from the first one, see QueryStats
+                    if rows and len(rows) * self.stats.row_size > threshold:
+                        spill = SpillFile(self._columns, self.spill_dir or getattr(self._conn, 'spill_dir', None))
+                        for start in range(0, len(rows), size):
+                            spill.append(rows[start:start + size])
+                        rows = None
+                if len(chunk) < size:
+                    break
+        except Exception:
+            if spill is not None:
+                spill.close()
+            raise
+        return rows if spill is None else spill.finish()
 
-                elif col_type in (1, 12):  # ('CHAR', 'VARCHAR')
-                    col = str(self._rs.getString(i)) if obj_val is not None else None
+    def _fetch_rows(self, size=None):
+        """Advance the result set by up to ``size`` rows (all if None) and convert them"""
+        start = time.perf_counter()
+        try:
+            rows = self._read_rows(size)
+        except Exception:
+            self._raise_if_cancelled()
+            raise
+        self.stats.add_rows(rows, time.perf_counter() - start)
+        return rows
 
-                elif col_type in (93, 2014):  # ('TIMESTAMP', 'TIMESTAMP_WITH_TIMEZONE')
-                    val = self._rs.getTimestamp(i)
-                    if val:
-                        d = datetime.datetime.strptime(str(val)[:19], '%Y-%m-%d %H:%M:%S')
-                        col = d.strftime('%Y-%m-%d %H:%M:%S')
+    def _read_rows(self, size=None):
+        if self._buffer is not None:
+            start = self._buffer_pos
+            end = len(self._buffer) if size is None else min(start + size, len(self._buffer))
+            self._buffer_pos = end
+            rows = self._buffer[start:end]
+            if self._rs is None or len(rows) == size:
+                return rows
+            # the rows read ahead by _fill_result_cache() or _read_lazy_rows()
+            # are served, stream the rest
+            self._buffer = None
+            return rows + self._read_rows(None if size is None else size - len(rows))
+        if self._lazy_rows():
+            return self._read_lazy_rows(size)
+        rs = self._rs
+        next_row = rs.next
+        was_null = rs.wasNull
+        converters = self._converters
+        rows = []
+        while size is None or len(rows) < size:
+            if not next_row():
+                break
+            row = []
+            for i, getter, convert, check_null in converters:
+                val = getter(i)
+                if val is None or (check_null and was_null()):
+                    row.append(None)
+                elif convert is None:
+                    row.append(val)
+                else:
+                    row.append(convert(val))
+            rows.append(tuple(row))
+        return rows
 
-                elif col_type in (92, 2013):  # ('TIME', 'TIME_WITH_TIMEZONE')
-                    val = self._rs.getTime(i)
-                    col = str(val) if val else ''
+    def _read_lazy_rows(self, size=None):
+        """Read up to ``size`` rows as Row views over ColumnBatch objects
 
-                elif col_type == 91:  # 'DATE'
-                    val = self._rs.getDate(i)
-                    if val:
-                        d = datetime.datetime.strptime(str(val)[:10], '%Y-%m-%d')
-                        col = d.strftime('%Y-%m-%d')
+        The rows are drained into a compact column store, see fetch_batch(),
+        and a cell becomes a Python object only when it is read, which saves
+        the conversions of the columns a wide scan never looks at. Decimals
+        are carried as their string to convert them exactly. Batches always
+        hold ``lazy_batch_rows`` rows, those beyond ``size`` wait in the
+        buffer for the next fetch.
+        """
+        if self._lazy_layout is None:
+            kinds = [KIND_OBJECT if col_type in _DECIMAL_TYPES else _column_kind(col_type)
+                     for col_type in self.columntype()]
+            decoders = [decimal.Decimal if col_type in _DECIMAL_TYPES else _CELL_DECODERS.get(kind)
+                        for col_type, kind in zip(self.columntype(), kinds)]
+            self._lazy_layout = kinds, decoders
+        kinds, decoders = self._lazy_layout
+        names = self.columnnames()
+        step = max(self.lazy_batch_rows, 1)
+        rows = []
+        while size is None or len(rows) < size:
+            batch = self._drain_batch(names, kinds, step)
+            batch.decoders = decoders
+            batch_rows = batch.rows()
+            if size is not None and len(rows) + batch.num_rows > size:
+                # served by _read_rows() before the next batch is drained
+                wanted = size - len(rows)
+                rows.extend(batch_rows[:wanted])
+                self._buffer = batch_rows
+                self._buffer_pos = wanted
+                break
+            rows.extend(batch_rows)
+            if batch.num_rows < step:
+                break
+        return rows
 
-                elif col_type in (-2, -3):  # ('BINARY', 'VARBINARY')
-                    col = self._rs.getBytes(i)
+    def _drain_batch(self, names, kinds, size):
+        fetcher_class = _get_row_batch_fetcher()
+        if fetcher_class is None:
+            return self._drain_python_batch(names, kinds, size)
+        if self._batch_fetcher is None or self._batch_fetcher_kinds != kinds:
+            self._batch_fetcher = fetcher_class(self._rs, jpype.JArray(jpype.JInt)(kinds))
+            self._batch_fetcher_kinds = kinds
+        return self._drain_java_batch(names, kinds, size)
 
-                elif col_type == 0:  # 'NULL'
-                    col = 'NULL'
-                else:
-                    col = self._rs.getString(i)
-                row.append(col)
-        return tuple(row)
+    def fetch_batch(self, size=None):
+        """Fetch up to ``size`` rows (default arraysize) as a ColumnBatch
 
-    def fetchmany(self, size=None):
-        if not self._rs:
-            # raise DataError('Not result set')
+        With RowBatchFetcher on the classpath the rows are drained inside the
+        JVM and every packed column is a view on the Java array, so a batch
+        costs a few JNI calls regardless of its size. The returned batch is
+        empty once the result set is exhausted.
+        """
+        if not self._has_result():
             return None
         if not size:
             size = self.arraysize
-        self._rs.setFetchSize(size)
-        rows = []
-        row = None
-        for i in range(size):
-            row = self.fetchone()
-            if not row:
-                break
+        start = time.perf_counter()
+        names = self.columnnames()
+        kinds = self.columnkinds()
+        try:
+            if self._buffer is not None:
+                batch = _rows_to_batch(names, kinds, self._read_rows(size))
             else:
-                rows.append(row)
-        return rows
+                batch = self._drain_batch(names, kinds, size)
+        except Exception:
+            self._raise_if_cancelled()
+            raise
+        self.stats.add_rows(batch.num_rows, time.perf_counter() - start)
+        return batch
 
-    def fetchall(self):
-        rows = []
-        while True:
-            row = self.fetchone()
-            if not row:
-                break
+    def fetchmany_numpy(self, size=None):
+        """Fetch up to ``size`` rows as ``(arrays, nulls)`` dicts of NumPy arrays keyed by column name"""
+        from .columnar import fetchmany_numpy
+        return fetchmany_numpy(self, size)
+
+    def fetchnumpy(self):
+        """Fetch all remaining rows as ``(arrays, nulls)`` dicts of NumPy arrays keyed by column name"""
+        from .columnar import fetch_numpy
+        return fetch_numpy(self)
+
+    def fetch_arrow_batches(self, batch_size=None):
+        """Yield the remaining rows as pyarrow.RecordBatch objects of up to ``batch_size`` rows"""
+        from .columnar import fetch_arrow_batches
+        return fetch_arrow_batches(self, batch_size)
+
+    def fetch_arrow_table(self, batch_size=None):
+        """Fetch all remaining rows as a pyarrow.Table"""
+        from .columnar import fetch_arrow_table
+        return fetch_arrow_table(self, batch_size)
+
+    def _drain_java_batch(self, names, kinds, size):
+        fetcher = self._batch_fetcher
+        num_rows = fetcher.fetch(size)
+        columns = []
+        nulls = []
+        for i, kind in enumerate(kinds):
+            values = fetcher.getColumn(i)
+            if kind in _PACKED_KINDS:
+                columns.append(_native_view(values)[:num_rows])
+            elif kind == KIND_BYTES:
+                columns.append([None if v is None else bytes(v) for v in values[:num_rows]])
             else:
-                rows.append(row)
-        return rows
+                columns.append([None if v is None else str(v) for v in values[:num_rows]])
+            nulls.append(memoryview(fetcher.getNulls(i))[:num_rows])
+        return ColumnBatch(names, kinds, columns, nulls, num_rows)
+
+    def _python_batch_readers(self, kinds):
+        """``(index, getter, check_null, pack, null value)`` per column, built once per result
+
+        Like the converters of the row path, the getters are bound once and
+        the UTC calendar is only created for results with temporal columns.
+        """
+        if self._batch_readers is not None and self._batch_readers[0] == kinds:
+            return self._batch_readers[1]
+        rs = self._rs
+        utc = _utc_calendar() if any(kind in _TEMPORAL_KINDS for kind in kinds) else None
+        readers = []
+        for index, kind in enumerate(kinds, 1):
+            if kind == KIND_LONG:
+                reader = rs.getLong, True, int, 0
+            elif kind == KIND_DOUBLE:
+                reader = rs.getDouble, True, float, 0.0
+            elif kind == KIND_BOOLEAN:
+                reader = rs.getBoolean, True, _pack_boolean, 0
+            elif kind == KIND_TIMESTAMP:
+                reader = _calendar_getter(rs.getTimestamp, utc), False, _pack_timestamp, 0
+            elif kind == KIND_DATE:
+                reader = _calendar_getter(rs.getDate, utc), False, _pack_date, 0
+            elif kind == KIND_TIME:
+                reader = _calendar_getter(rs.getTime, utc), False, _pack_time, 0
+            elif kind == KIND_BYTES:
+                reader = rs.getBytes, False, bytes, None
+            else:
+                reader = rs.getString, False, str, None
+            readers.append((index,) + reader)
+        self._batch_readers = kinds, readers
+        return readers
+
+    def _drain_python_batch(self, names, kinds, size):
+        rs = self._rs
+        next_row = rs.next
+        was_null = rs.wasNull
+        readers = self._python_batch_readers(kinds)
+        columns = []
+        for kind in kinds:
+            if kind == KIND_DOUBLE:
+                columns.append(array('d'))
+            elif kind == KIND_BOOLEAN:
+                columns.append(bytearray())
+            elif kind in _PACKED_KINDS:
+                columns.append(array('q'))
+            else:
+                columns.append([])
+        nulls = [bytearray() for _ in kinds]
+        cells = [(reader, columns[i].append, nulls[i].append) for i, reader in enumerate(readers)]
+        num_rows = 0
+        while num_rows < size and next_row():
+            for (index, getter, check_null, pack, null_value), append, append_null in cells:
+                val = getter(index)
+                if val is None or (check_null and was_null()):
+                    append(null_value)
+                    append_null(1)
+                else:
+                    append(pack(val))
+                    append_null(0)
+            num_rows += 1
+        columns = [memoryview(col) if kind in _PACKED_KINDS else col for kind, col in zip(kinds, columns)]
+        return ColumnBatch(names, kinds, columns, [memoryview(mask) for mask in nulls], num_rows)
 
     def columnnames(self):
-        if not self._rs_meta:
-            return []
-        names = []
-        column_count = self._rs_meta.getColumnCount()
-        for i in range(1, column_count + 1):
-            names.append(str(self._rs_meta.getColumnName(i)))
-        return names
+        return [column[0] for column in self._columns or ()]
 
     def columntypenames(self):
-        if not self._rs_meta:
-            return []
-        names = []
-        column_count = self._rs_meta.getColumnCount()
-        for i in range(1, column_count + 1):
-            names.append(str(self._rs_meta.getColumnTypeName(i)))
-        return names
+        return [column[1] for column in self._columns or ()]
 
     def columntype(self):
-        if not self._rs_meta:
-            return []
-        names = []
-        column_count = self._rs_meta.getColumnCount()
-        for i in range(1, column_count + 1):
-            names.append(self._rs_meta.getColumnType(i))
-        return names
+        return [column[2] for column in self._columns or ()]
+
+    def columnkinds(self):
+        return [_column_kind(col_type) for col_type in self.columntype()]
+
+    def cancel(self):
+        """Abort the statement currently executing or fetching, from any thread
+
+        The statement is closed instead of going back to the statement cache
+        and the call waiting on it raises OperationalError.
+        """
+        with self._cancel_lock:
+            self._cancel()
+
+    def _cancel(self):
+        # called with _cancel_lock held, _close_last() cannot hand the statement over meanwhile
+        self._cancelled = True
+        stmt = self._stmt
+        if stmt is not None:
+            attach_JVM_thread()
+            stmt.cancel()
 
     def nextset(self):
         raise NotSupportedError('nextset() not supported')
@@ -333,3 +1521,25 @@ class Cursor(object):
 
     def setoutputsize(self, size, column=None):
         raise NotSupportedError('setoutputsize(size[, column ]) not supported')
+
+
+class StreamingCursor(Cursor):
+    """Cursor streaming a large result in chunks of ``fetch_size`` rows
+
+    The fetch size is set on the statement before it executes and stays
+    fixed, results never go through the result cache and iterating fetches
+    at most one chunk ahead, so the memory held is bounded by the chunk size
+    as long as the rows are consumed with fetchone(), fetchmany() or
+    iteration rather than fetchall().
+    """
+    fetch_size = 1000
+    prefetch_depth = 1
+
+    def __init__(self, conn, fetch_size=None):
+        super(StreamingCursor, self).__init__(conn)
+        if fetch_size:
+            self.fetch_size = int(fetch_size)
+        self.arraysize = self.fetch_size
+
+    def _result_cache(self, operation):
+        return None
@@ -0,0 +1,84 @@
+"""Column-wise encoding of converted rows, used for the shared memory
+results of process.py and the temp files of spill.py"""
+from __future__ import absolute_import
+
+import datetime
+import decimal
+from array import array
+
+from .calcite4py import (_column_kind, _pack_value, _DECIMAL_TYPES, _EPOCH, _EPOCH_ORDINAL, KIND_LONG, KIND_DOUBLE,
+                         KIND_BOOLEAN, KIND_TIMESTAMP, KIND_DATE, KIND_TIME, KIND_BYTES)
+
+# column codes of the encoded layout
+_INT64_CODES = {KIND_LONG: 'q', KIND_TIMESTAMP: 'ts', KIND_DATE: 'date', KIND_TIME: 'time'}
+_INT64_KINDS = dict((code, kind) for kind, code in _INT64_CODES.items())
+
+
+def _column_code(col_type):
+    if col_type in _DECIMAL_TYPES:
+        return 'dec'
+    kind = _column_kind(col_type)
+    if kind in _INT64_CODES:
+        return _INT64_CODES[kind]
+    if kind == KIND_DOUBLE:
+        return 'd'
+    if kind == KIND_BOOLEAN:
+        return '?'
+    if kind == KIND_BYTES:
+        return 'bytes'
+    return 'str'
+
+
+def _encode_column(code, values):
+    """Serialize one column of converted values to bytes, see _decode_column"""
+    if code in _INT64_KINDS:
+        kind = _INT64_KINDS[code]
+        return array('q', [0 if value is None else _pack_value(kind, value) for value in values]).tobytes()
+    if code == 'd':
+        return array('d', [0.0 if value is None else value for value in values]).tobytes()
+    if code == '?':
+        return bytes(bytearray(1 if value else 0 for value in values))
+    if code == 'bytes':
+        blobs = [b'' if value is None else bytes(value) for value in values]
+    else:
+        # decimals are stored as text
+        blobs = [b'' if value is None else str(value).encode('utf-8') for value in values]
+    offsets = array('q', [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return offsets.tobytes() + b''.join(blobs)
+
+
+def _decode_column(code, data, nulls, num_rows):
+    if code in ('q', 'ts', 'date', 'time', 'd'):
+        values = array('d' if code == 'd' else 'q')
+        values.frombytes(data)
+        if code == 'ts':
+            values = [_EPOCH + datetime.timedelta(microseconds=value) for value in values]
+        elif code == 'date':
+            values = [datetime.date.fromordinal(_EPOCH_ORDINAL + value) for value in values]
+        elif code == 'time':
+            values = [(datetime.datetime.min + datetime.timedelta(microseconds=value)).time() for value in values]
+        else:
+            values = values.tolist()
+    elif code == '?':
+        values = [bool(value) for value in data]
+    else:
+        offsets = array('q')
+        offsets.frombytes(data[:(num_rows + 1) * 8])
+        blob = data[(num_rows + 1) * 8:]
+        values = [blob[offsets[i]:offsets[i + 1]] for i in range(num_rows)]
+        if code == 'str':
+            values = [value.decode('utf-8') for value in values]
+        elif code == 'dec':
+            # NULL cells are empty
+            values = [decimal.Decimal(value.decode('ascii')) if value else None for value in values]
+    return [None if null else value for value, null in zip(values, nulls)]
+
+
+def encode_rows(codes, rows):
+    """Yield ``(nulls, data)`` for every column of ``rows``, ``codes`` from _column_code"""
+    for i, code in enumerate(codes):
+        values = [row[i] for row in rows]
+        nulls = bytes(bytearray(1 if value is None else 0 for value in values))
+        yield nulls, _encode_column(code, values)
@@ -0,0 +1,308 @@
+from __future__ import absolute_import
+
+from .calcite4py import (NotSupportedError, ProgrammingError, KIND_LONG, KIND_DOUBLE, KIND_BOOLEAN,
+                         KIND_TIMESTAMP, KIND_DATE, KIND_TIME)
+
+# rows drained per ColumnBatch when a whole result is fetched column-wise
+DEFAULT_BATCH_SIZE = 10000
+
+_NUMPY_DTYPES = {
+    KIND_LONG: 'int64',
+    KIND_DOUBLE: 'float64',
+    KIND_BOOLEAN: 'bool',
+    KIND_TIMESTAMP: 'datetime64[us]',
+    KIND_DATE: 'datetime64[D]',
+    KIND_TIME: 'timedelta64[us]',
+}
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise NotSupportedError('numpy is required for columnar fetches, pip install numpy')
+    return numpy
+
+
+def _batch_size(cursor):
+    return max(cursor.arraysize, DEFAULT_BATCH_SIZE)
+
+
+def batch_to_numpy(batch):
+    """Convert a ColumnBatch to ``(arrays, nulls)`` dicts keyed by column name
+
+    Packed columns are viewed in place with their natural dtype (see
+    _NUMPY_DTYPES), the others become object arrays. NULL cells hold 0 (or
+    None for object arrays) and are flagged in the bool mask of ``nulls``.
+    """
+    np = _import_numpy()
+    arrays = {}
+    nulls = {}
+    for name, kind, values, mask in zip(batch.names, batch.kinds, batch.columns, batch.nulls):
+        dtype = _NUMPY_DTYPES.get(kind, object)
+        if not batch.num_rows:
+            array = np.empty(0, dtype=dtype)
+        elif dtype is object:
+            array = np.empty(batch.num_rows, dtype=object)
+            array[:] = values
+        elif kind in (KIND_DOUBLE, KIND_BOOLEAN):
+            array = np.frombuffer(values, dtype=dtype)
+        else:
+            array = np.frombuffer(values, dtype=np.int64).view(dtype)
+        arrays[name] = array
+        nulls[name] = np.frombuffer(mask, dtype=bool) if batch.num_rows else np.empty(0, dtype=bool)
+    return arrays, nulls
+
+
+def fetchmany_numpy(cursor, size=None):
+    batch = cursor.fetch_batch(size)
+    if batch is None:
+        return None
+    return batch_to_numpy(batch)
+
+
+def fetch_numpy(cursor):
+    """Fetch the remaining rows of ``cursor`` as ``(arrays, nulls)``, see batch_to_numpy"""
+    np = _import_numpy()
+    size = _batch_size(cursor)
+    chunks = []
+    while True:
+        batch = cursor.fetch_batch(size)
+        if batch is None:
+            return None
+        # keep the empty batch of a result without rows for its dtypes
+        if batch.num_rows or not chunks:
+            chunks.append(batch_to_numpy(batch))
+        if batch.num_rows < size:
+            break
+    if len(chunks) == 1:
+        # views on a batch are read-only and pin the Java arrays, detach them
+        return tuple(dict((k, v.copy()) for k, v in part.items()) for part in chunks[0])
+    names = list(chunks[0][0].keys())
+    arrays = dict((name, np.concatenate([chunk[0][name] for chunk in chunks])) for name in names)
+    nulls = dict((name, np.concatenate([chunk[1][name] for chunk in chunks])) for name in names)
+    return arrays, nulls
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise NotSupportedError('pyarrow is required for Arrow fetches, pip install pyarrow')
+    return pyarrow
+
+
+def _arrow_type(pa, col_type):
+    # see https://docs.oracle.com/javase/8/docs/api/constant-values.html#java.sql.Types.ARRAY
+    if col_type == -6:  # TINYINT
+        return pa.int8()
+    if col_type == 5:  # SMALLINT
+        return pa.int16()
+    if col_type == 4:  # INTEGER
+        return pa.int32()
+    if col_type == -5:  # BIGINT
+        return pa.int64()
+    if col_type == 7:  # REAL
+        return pa.float32()
+    if col_type in (6, 8, 3, 2):  # FLOAT (double precision in JDBC), DOUBLE, DECIMAL, NUMERIC (drained as doubles)
+        return pa.float64()
+    if col_type in (-7, 16):  # BIT, BOOLEAN
+        return pa.bool_()
+    if col_type in (93, 2014):  # TIMESTAMP, TIMESTAMP_WITH_TIMEZONE
+        return pa.timestamp('us')
+    if col_type == 91:  # DATE
+        return pa.date32()
+    if col_type in (92, 2013):  # TIME, TIME_WITH_TIMEZONE
+        return pa.time64('us')
+    if col_type in (-2, -3):  # BINARY, VARBINARY
+        return pa.binary()
+    return pa.string()
+
+
+def arrow_schema(cursor):
+    """Build a pyarrow.Schema from the ResultSetMetaData of ``cursor``"""
+    pa = _import_pyarrow()
+    fields = [pa.field(name, _arrow_type(pa, col_type), nullable=nullable)
+              for name, _, col_type, nullable in cursor._columns or ()]
+    return pa.schema(fields)
+
+
+def batch_to_arrow(batch, schema):
+    pa = _import_pyarrow()
+    arrays, nulls = batch_to_numpy(batch)
+    columns = []
+    for name, kind, field in zip(batch.names, batch.kinds, schema):
+        values = arrays[name]
+        mask = nulls[name] if nulls[name].any() else None
+        if kind == KIND_TIME:
+            column = pa.array(values.view('int64'), mask=mask).cast(field.type)
+        elif kind == KIND_LONG or kind == KIND_DOUBLE:
+            column = pa.array(values, mask=mask).cast(field.type)
+        else:
+            column = pa.array(values, mask=mask, type=field.type)
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def fetch_arrow_batches(cursor, batch_size=None):
+    """Yield the remaining rows of ``cursor`` as pyarrow.RecordBatch of up to ``batch_size`` rows"""
+    if not cursor._has_result():
+        return
+    schema = arrow_schema(cursor)
+    size = batch_size or _batch_size(cursor)
+    while True:
+        batch = cursor.fetch_batch(size)
+        if not batch:
+            break
+        yield batch_to_arrow(batch, schema)
+        if batch.num_rows < size:
+            break
+
+
+def fetch_arrow_table(cursor, batch_size=None):
+    pa = _import_pyarrow()
+    if not cursor._has_result():
+        return None
+    schema = arrow_schema(cursor)
+    return pa.Table.from_batches(list(fetch_arrow_batches(cursor, batch_size)), schema=schema)
+
+
+def _import_pandas():
+    try:
+        import pandas
+    except ImportError:
+        raise NotSupportedError('pandas is required for read_dataframe(), pip install pandas')
+    return pandas
+
+
+def _pandas_column(pd, values, mask):
+    """Wrap a numpy column and its null mask in the pandas array that keeps its dtype"""
+    kind = values.dtype.kind
+    # integers and booleans always use the nullable arrays so that every
+    # chunk of a result gets the same dtype
+    if kind == 'i':
+        return pd.arrays.IntegerArray(values, mask.copy())
+    if kind == 'b':
+        return pd.arrays.BooleanArray(values, mask.copy())
+    if not mask.any() or kind == 'O':
+        return values
+    values = values.copy()
+    if kind == 'f':
+        values[mask] = float('nan')
+    else:  # datetime64 / timedelta64
+        values[mask] = values.dtype.type('NaT')
+    return values
+
+
+def batch_to_dataframe(batch):
+    pd = _import_pandas()
+    arrays, nulls = batch_to_numpy(batch)
+    data = dict((name, _pandas_column(pd, arrays[name], nulls[name])) for name in batch.names)
+    return pd.DataFrame(data, columns=batch.names, copy=False)
+
+
+def _dbapi_connection(connection):
+    """Return ``(dbapi_connection, owned)`` for a pycalcite Connection or SQLAlchemy Engine/Connection"""
+    if hasattr(connection, 'raw_connection'):  # sqlalchemy Engine
+        return connection.raw_connection(), True
+    if not hasattr(connection, 'cursor') and hasattr(connection, 'connection'):  # sqlalchemy Connection
+        return connection.connection, False
+    return connection, False
+
+
+def _iter_dataframes(cursor, dbapi_connection, owned, chunksize):
+    try:
+        first = True
+        while True:
+            batch = cursor.fetch_batch(chunksize)
+            if batch is None:
+                break
+            if batch.num_rows or first:
+                yield batch_to_dataframe(batch)
+            first = False
+            if batch.num_rows < chunksize:
+                break
+    finally:
+        cursor.close()
+        if owned:
+            dbapi_connection.close()
+
+
+def read_dataframe(sql, connection, params=None, chunksize=None):
+    """Run ``sql`` and return its result as a pandas.DataFrame
+
+    Columns are built from the result set buffers with their final dtypes
+    (int64, float64, bool, datetime64[us], datetime64[D], timedelta64[us] or
+    object); integer and boolean columns use the pandas nullable
+    Int64/boolean arrays. With ``chunksize`` an iterator of
+    DataFrames of up to ``chunksize`` rows is returned instead.
+    """
+    _import_pandas()
+    dbapi_connection, owned = _dbapi_connection(connection)
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(sql, params)
+    except Exception:
+        cursor.close()
+        if owned:
+            dbapi_connection.close()
+        raise
+    if chunksize:
+        return _iter_dataframes(cursor, dbapi_connection, owned, chunksize)
+    frames = list(_iter_dataframes(cursor, dbapi_connection, owned, _batch_size(cursor)))
+    if len(frames) == 1:
+        return frames[0]
+    return _import_pandas().concat(frames, ignore_index=True)
+
+
+def _column_values(values):
+    """Python values of one parameter column, NaN/NaT/NA becoming None"""
+    if hasattr(values, 'to_pylist'):  # pyarrow Array/ChunkedArray
+        return values.to_pylist()
+    if hasattr(values, 'notna'):  # pandas Series
+        return values.astype(object).where(values.notna(), None).tolist()
+    dtype = getattr(values, 'dtype', None)
+    if dtype is None:
+        return list(values)
+    if dtype.kind == 'M':
+        # tolist() of nanosecond datetime64 gives integers
+        return values.astype('datetime64[us]').tolist()
+    if dtype.kind == 'm':
+        return values.astype('timedelta64[us]').tolist()
+    values = values.tolist()
+    if dtype.kind == 'f':
+        return [None if value != value else value for value in values]
+    return values
+
+
+def parameter_rows(parameters, names=None):
+    """Iterate over the parameter sets of executemany(), as rows
+
+    Columnar ``parameters`` (a dict of columns, a NumPy 2-D or structured
+    array, a pandas DataFrame or a pyarrow Table/RecordBatch) are turned into
+    rows column by column. Their columns are matched by name to pyformat
+    placeholders ``names`` and taken in order for positional ones. Any other
+    sequence is returned as it is.
+    """
+    if hasattr(parameters, 'column_names') and hasattr(parameters, 'column'):  # pyarrow
+        columns = [(name, parameters.column(name)) for name in parameters.column_names]
+    elif isinstance(parameters, dict):
+        columns = list(parameters.items())
+    elif hasattr(parameters, 'dtype') and hasattr(parameters, 'ndim'):  # numpy
+        if parameters.dtype.names:
+            columns = [(name, parameters[name]) for name in parameters.dtype.names]
+        elif parameters.ndim == 2:
+            columns = [(None, parameters[:, i]) for i in range(parameters.shape[1])]
+        else:
+            raise NotSupportedError('executemany() takes 2-D or structured NumPy arrays')
+    elif hasattr(parameters, 'columns') and hasattr(parameters, 'iloc'):  # pandas DataFrame
+        columns = [(name, parameters[name]) for name in parameters.columns]
+    else:
+        return parameters
+    if names and all(name is not None for name in names):
+        by_name = dict(columns)
+        missing = [name for name in names if name not in by_name]
+        if missing:
+            raise ProgrammingError('no parameter column for %s' % ', '.join(missing))
+        columns = [(name, by_name[name]) for name in names]
+    return zip(*[_column_values(values) for _, values in columns])
@@ -3,10 +3,14 @@ from __future__ import absolute_import
 import os
 import gc
 import json
+import weakref
 
 # from .cursor import Cursor
 from .log import logger
-from .calcite4py import Calcite4py, Cursor, stop_JVM
+from .calcite4py import Calcite4py, Cursor, StatementCache, StreamingCursor, stop_JVM
+from .pool import BridgePool, fingerprint
+from .cache import ResultCache, default_result_cache
+from .jvm import get_JVM_options
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 HIVE_DRIVER_NAME = 'org.apache.hadoop.hive.jdbc.HiveDriver'
@@ -24,12 +28,69 @@ HIVE_DRIVER_NAME = 'org.apache.hadoop.hive.jdbc.HiveDriver'
 def _build_connection(json_str, lex='MYSQL'):
     logger.debug('json_str=%s' % json_str)
     # jar_paths = [os.path.join(BASE_DIR, 'jar', 'dialect_calcite.jar'), os.path.join(BASE_DIR, 'jar', 'ojdbc8-19.7.0.0.jar')]
-    jar_paths = [os.path.join(BASE_DIR, 'jar', 'dialect_calcite.jar')]
-    jdbc = Calcite4py(jar_paths=jar_paths, json_str=json_str, lex=lex)
+    # configured with jvm.configure_JVM(), used by the first connection only
+    jvm_options = get_JVM_options()
+    jdbc = Calcite4py(jar_paths=jvm_options.classpath(json_str), json_str=json_str, lex=lex,
+                      jvm_args=jvm_options.to_args())
     return jdbc.connect()
 
 
+def _as_bool(value):
+    # options may come as strings from the SQLAlchemy URL query
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def _result_cache_option(value):
+    # opt-in ResultCache, True shares cache.default_result_cache
+    if isinstance(value, ResultCache):
+        return value
+    return default_result_cache if _as_bool(value) else None
+
+
+def _timeout_option(value):
+    # seconds, None or 0 for no timeout
+    return float(value) if value else None
+
+
+def _set_bridge_property(bridge, name, value):
+    """Set a connection property CalciteBridge does not pass to jdbc:calcite:, None removes it
+
+    CalciteConnection.config() reads the live properties of the connection,
+    the statements prepared afterwards see ``value``. Returns the previous
+    value, which Connection._close_bridge() puts back before a pooled bridge
+    is released.
+    """
+    import jpype
+    stmt = bridge.createStatement()
+    try:
+        calcite_connection = stmt.getConnection().unwrap(jpype.JClass('org.apache.calcite.jdbc.CalciteConnection'))
+    finally:
+        stmt.close()
+    properties = calcite_connection.getProperties()
+    previous = properties.getProperty(name)
+    if value is None:
+        properties.remove(name)
+    else:
+        properties.setProperty(name, value)
+    return None if previous is None else str(previous)
+
+
+# warm CalciteBridge instances shared by every Connection of the process,
+# tune it with bridge_pool.configure(min_size=..., max_size=..., idle_timeout=...)
+bridge_pool = BridgePool(_build_connection)
+
+
 class Connection(object):
+    """DB-API connection over a CalciteBridge checked out of bridge_pool
+
+    A connection and its cursors must be used by one thread at a time
+    (threadsafety 1); give each thread its own connection. Bridges are
+    pooled per process, and a pooled bridge belongs to one connection at a
+    time.
+    """
+
     def __init__(self, username=None, password=None, host=None, port=None, database=None, **kwargs):
         self.host = host
         self.database = database
@@ -37,14 +98,91 @@ class Connection(object):
         self.username = username
         self.password = password
         self.limit = kwargs['limit'] if 'limit' in kwargs else 5000000
-        self.con_json_dct = kwargs.get('con_json_dict', {})
+        # copied: the caller's dict may be shared by connections opened in parallel
+        self.con_json_dct = dict(kwargs.get('con_json_dict', {}))
         self.lex_type = self.con_json_dct.get('lex', 'MYSQL')
         # self.conn = _build_connection(self.host, self.port, self.database, self.username, self.password)
         if 'lex' in self.con_json_dct:
             del self.con_json_dct['lex']
-        self.conn = _build_connection(json.dumps(self.con_json_dct), self.lex_type)
+        self.use_bridge_pool = _as_bool(kwargs.get('use_bridge_pool', True))
+        self.json_str = json.dumps(self.con_json_dct)
+        self.fingerprint = fingerprint(self.json_str, self.lex_type)
+        self._generation = None
+        self._jdbc_conn = None
+        # let the planner rewrite queries against the materializations and
+        # lattice tiles of the model, None keeps the default of the bridge
+        self.materializations_enabled = (_as_bool(kwargs['materializations_enabled'])
+                                         if kwargs.get('materializations_enabled') is not None else None)
+        self.conn = self._open_bridge()
+        self.result_cache = _result_cache_option(kwargs.get('result_cache'))
+        # default Cursor.timeout of the statements of this connection
+        self.query_timeout = _timeout_option(kwargs.get('query_timeout'))
+        # fetchall() results beyond spill_threshold bytes go to a temp file in spill_dir
+        self.spill_threshold = int(kwargs['spill_threshold']) if kwargs.get('spill_threshold') else None
+        self.spill_dir = kwargs.get('spill_dir')
+        # cursors fetch Row views decoding their cells on access, see Cursor.lazy_rows
+        self.lazy_rows = _as_bool(kwargs.get('lazy_rows', False))
+        self.statement_cache = StatementCache(self.jdbc_connection, int(kwargs.get('statement_cache_size', 64)))
         self._closed = False
-        self._cursor = None
+        # every cursor not yet garbage collected, closed with the bridge
+        self._cursors = weakref.WeakSet()
+
+    def _open_bridge(self):
+        if self.use_bridge_pool:
+            self._generation = bridge_pool.generation(self.fingerprint)
+            bridge = bridge_pool.acquire(self.fingerprint, self.json_str, self.lex_type)
+        else:
+            bridge = _build_connection(self.json_str, self.lex_type)
+        # properties changed on the bridge and their previous values
+        self._bridge_defaults = {}
+        if self.materializations_enabled is not None:
+            self._bridge_defaults['materializationsEnabled'] = _set_bridge_property(
+                bridge, 'materializationsEnabled', str(self.materializations_enabled).lower())
+        return bridge
+
+    def _restore_bridge_defaults(self):
+        """Undo the property changes of _open_bridge(), False if the bridge could not be restored"""
+        for name, value in self._bridge_defaults.items():
+            try:
+                _set_bridge_property(self.conn, name, value)
+            except Exception as ex:
+                logger.debug('restoring %s failed: %s' % (name, ex))
+                return False
+        self._bridge_defaults = {}
+        return True
+
+    def _bridge_is_stale(self):
+        return self.use_bridge_pool and bridge_pool.generation(self.fingerprint) != self._generation
+
+    def jdbc_connection(self):
+        """The java.sql.Connection of the bridge, reached through one of its statements"""
+        if self._jdbc_conn is None:
+            stmt = self.conn.createStatement()
+            try:
+                self._jdbc_conn = stmt.getConnection()
+            finally:
+                stmt.close()
+        return self._jdbc_conn
+
+    def _close_cursors(self):
+        # their statements and result sets must not follow the bridge into the pool
+        for cursor in list(self._cursors):
+            try:
+                cursor.close()
+            except Exception as ex:
+                logger.debug('closing cursor failed: %s' % ex)
+        self._cursors.clear()
+
+    def _close_bridge(self):
+        self._close_cursors()
+        self.statement_cache.clear()
+        self._jdbc_conn = None
+        if self.use_bridge_pool:
+            # a bridge keeping another connection's settings is not reused
+            discard = self._bridge_is_stale() or not self._restore_bridge_defaults()
+            bridge_pool.release(self.fingerprint, self.conn, discard=discard)
+        else:
+            self.conn.close()
 
     def __enter__(self):
         """Transport should already be opened by __init__"""
@@ -58,8 +196,7 @@ class Connection(object):
     def close(self):
         try:
             if not self._closed:
-                self.conn.close()
-            self._cursor.close()
+                self._close_bridge()
         except:
             pass
         # stop_JVM()
@@ -75,13 +212,22 @@ class Connection(object):
     def rollback(self):
         logger.warn('Transactional rollback is not supported')
 
-    def cursor(self):
-        self._cursor = Cursor(self)
-        return self._cursor
+    def cursor(self, streaming=False, fetch_size=None):
+        """Open a Cursor, or a StreamingCursor fetching ``fetch_size`` rows at a time"""
+        if self._bridge_is_stale() and not self._closed:
+            # the model was refreshed, see model.Model.refresh()
+            self._close_bridge()
+            self.conn = self._open_bridge()
+        if streaming:
+            cursor = StreamingCursor(self, fetch_size)
+        else:
+            cursor = Cursor(self)
+        self._cursors.add(cursor)
+        return cursor
 
     def reconnect(self):
         if self._closed:
-            self.conn = _build_connection(json.dumps(self.con_json_dct), self.lex_type)
+            self.conn = self._open_bridge()
             self._closed = False
 
     def connection_closed(self):
@@ -89,4 +235,11 @@ class Connection(object):
 
 
 def connect(username=None, password=None, host=None, port=None, database=None, **kwargs):
+    """Open a Connection, or a process.ProcessConnection with ``isolation='process'``"""
+    isolation = kwargs.pop('isolation', None)
+    if isolation == 'process':
+        from .process import ProcessConnection
+        return ProcessConnection(username, password, host, port, database, **kwargs)
+    if isolation not in (None, 'thread'):
+        raise ValueError("isolation must be 'thread' or 'process', not %r" % isolation)
     return Connection(username, password, host, port, database, **kwargs)
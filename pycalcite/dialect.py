@@ -1,99 +1,65 @@
 from __future__ import absolute_import
 
-import datetime
-import decimal
-
+import contextlib
 import re
+
 from sqlalchemy import exc
-from sqlalchemy import processors
 from sqlalchemy import types
 from sqlalchemy import util
 from sqlalchemy.engine.base import Engine
 # TODO shouldn't use mysql type
-from sqlalchemy.databases import mysql
+from sqlalchemy.dialects import mysql
 from sqlalchemy.engine import default
 from sqlalchemy.sql import compiler
 from sqlalchemy.sql.compiler import SQLCompiler
 from pyhive.common import UniversalSet
 
-from dateutil.parser import parse
-from decimal import Decimal
+from .metadata import MetadataCache, TableIndex
 
 
 class HiveStringTypeBase(types.TypeDecorator):
     """Translates strings returned by Thrift into something else"""
     impl = types.String
+    # no state beyond the class, safe in SQLAlchemy cache keys; SQLAlchemy
+    # reads cache_ok from each class itself, so every subclass repeats it
+    cache_ok = True
 
     def process_bind_param(self, value, dialect):
         raise NotImplementedError("Writing to Hive not supported")
 
 
 class HiveDate(HiveStringTypeBase):
-    """Translates date strings to date objects"""
+    """Dates, already built as datetime.date by the cursor"""
     impl = types.DATE
-
-    def process_result_value(self, value, dialect):
-        return processors.str_to_date(value)
+    cache_ok = True
 
     def result_processor(self, dialect, coltype):
-        def process(value):
-            if isinstance(value, datetime.datetime):
-                return value.date()
-            elif isinstance(value, datetime.date):
-                return value
-            elif value is not None:
-                return parse(value).date()
-            else:
-                return None
-
-        return process
+        # pass the values through untouched
+        return None
 
     def adapt(self, impltype, **kwargs):
         return self.impl
 
 
 class HiveTimestamp(HiveStringTypeBase):
-    """Translates timestamp strings to datetime objects"""
+    """Timestamps, already built as datetime.datetime by the cursor"""
     impl = types.TIMESTAMP
-
-    def process_result_value(self, value, dialect):
-        return processors.str_to_datetime(value)
+    cache_ok = True
 
     def result_processor(self, dialect, coltype):
-        def process(value):
-            if isinstance(value, datetime.datetime):
-                return value
-            elif value is not None:
-                return parse(value)
-            else:
-                return None
-
-        return process
+        return None
 
     def adapt(self, impltype, **kwargs):
         return self.impl
 
 
 class HiveDecimal(HiveStringTypeBase):
-    """Translates strings to decimals"""
+    """Decimals, already built as decimal.Decimal by the cursor"""
     impl = types.DECIMAL
-
-    def process_result_value(self, value, dialect):
-        if value is not None:
-            return decimal.Decimal(value)
-        else:
-            return None
+    cache_ok = True
 
     def result_processor(self, dialect, coltype):
-        def process(value):
-            if isinstance(value, Decimal):
-                return value
-            elif value is not None:
-                return Decimal(value)
-            else:
-                return None
-
-        return process
+        return None
 
     def adapt(self, impltype, **kwargs):
         return self.impl
@@ -110,28 +76,48 @@ class HiveIdentifierPreparer(compiler.IdentifierPreparer):
         )
 
 
+def _column_list_end(text, start):
+    """Index after the ``)`` closing the column list that starts at ``start``, skipping quoted names"""
+    quoted = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if char == '`':
+            # doubled backticks inside a name toggle twice
+            quoted = not quoted
+        elif char == ')' and not quoted:
+            return i + 1
+    return -1
+
+
 class HiveCompiler(SQLCompiler):
+    # compiled statements are cached by SQLAlchemy: the rewrites below only
+    # depend on the statement structure, never on parameter values
+
     def visit_concat_op_binary(self, binary, operator, **kw):
-        return "concat(%s, %s)" % (self.process(binary.left), self.process(binary.right))
+        return "concat(%s, %s)" % (self.process(binary.left, **kw), self.process(binary.right, **kw))
 
-    def visit_insert(self, *args, **kwargs):
-        result = super(HiveCompiler, self).visit_insert(*args, **kwargs)
+    def visit_insert(self, insert_stmt, **kw):
+        result = super(HiveCompiler, self).visit_insert(insert_stmt, **kw)
         # Massage the result into Hive's format
         #   INSERT INTO `pyhive_test_database`.`test_table` (`a`) SELECT ...
         #   =>
         #   INSERT INTO TABLE `pyhive_test_database`.`test_table` SELECT ...
-        regex = r'^(INSERT INTO) ([^\s]+) \([^\)]*\)'
-        assert re.search(regex, result), "Unexpected visit_insert result: {}".format(result)
-        return re.sub(regex, r'\1 TABLE \2', result)
-
-    def visit_column(self, *args, **kwargs):
-        result = super(HiveCompiler, self).visit_column(*args, **kwargs)
-        dot_count = result.count('.')
-        assert dot_count in (0, 1, 2), "Unexpected visit_column result {}".format(result)
-        if dot_count == 2:
-            # we have something of the form schema.table.column
-            # hive doesn't like the schema in front, so chop it out
-            result = result[result.index('.') + 1:]
+        table_text = self.preparer.format_table(insert_stmt.table)
+        prefix = 'INSERT INTO %s (' % table_text
+        end = _column_list_end(result, len(prefix)) if result.startswith(prefix) else -1
+        assert end > 0, "Unexpected visit_insert result: {}".format(result)
+        return 'INSERT INTO TABLE %s%s' % (table_text, result[end:])
+
+    def visit_column(self, column, include_table=True, **kwargs):
+        result = super(HiveCompiler, self).visit_column(column, include_table=include_table, **kwargs)
+        table = column.table
+        if include_table and table is not None and table.named_with_column:
+            schema = self.preparer.schema_for_object(table)
+            if schema:
+                # schema.table.column: hive doesn't like the schema in front, so chop it out
+                prefix = self.preparer.quote_schema(schema) + '.'
+                if result.startswith(prefix):
+                    result = result[len(prefix):]
         return result
 
     def visit_char_length_func(self, fn, **kw):
@@ -175,7 +161,7 @@ class HiveTypeCompiler(compiler.GenericTypeCompiler):
 
 _type_map = {
     'boolean': types.Boolean,
-    'tinyint': mysql.MSTinyInteger,
+    'tinyint': mysql.TINYINT,
     'smallint': types.SmallInteger,
     'int': types.Integer,
     'bigint': types.BigInteger,
@@ -194,6 +180,77 @@ _type_map = {
 }
 
 
+def _column_info(column):
+    """get_columns() entry of a CalciteBridge TableColumnMetaInfo"""
+    return {
+        'name': str(column.getColumnName()),
+        'type': _type_map.get(column.getColumnType().toLowerCase(), types.NullType),
+        'nullable': column.getNullable() != 0,
+        'default': None
+    }
+
+
+def _columns_by_table(columns_list):
+    """get_columns() entries of TableColumnMetaInfo rows grouped by table name
+
+    Rows of a ``None`` schema span every schema; a table name keeps the
+    columns of the first schema listing it rather than merging same-named
+    tables.
+    """
+    tables = {}
+    schemas = {}
+    for column in columns_list:
+        table_name = str(column.getTableName())
+        schema_name = str(column.getSchemaName())
+        if schemas.setdefault(table_name, schema_name) == schema_name:
+            tables.setdefault(table_name, []).append(_column_info(column))
+    return tables
+
+
+def _reflects_tables(scope, kind):
+    # ObjectScope / ObjectKind of the SQLAlchemy 2.0 multi reflection: the
+    # schemas reflect neither temporary tables nor views, see get_view_names()
+    if scope is None and kind is None:
+        return True
+    from sqlalchemy.engine.reflection import ObjectKind, ObjectScope
+    return (scope is None or ObjectScope.DEFAULT in scope) and (kind is None or ObjectKind.TABLE in kind)
+
+
+@contextlib.contextmanager
+def _calcite_connection(connection):
+    """Yield the pycalcite Connection behind a SQLAlchemy Engine or Connection"""
+    if isinstance(connection, Engine):
+        raw_connection = connection.raw_connection()
+        try:
+            connection_object = raw_connection.connection
+            if connection_object.connection_closed():
+                connection_object.reconnect()
+            yield connection_object
+        finally:
+            # hand the connection back to the engine pool
+            raw_connection.close()
+    else:
+        yield connection.connection.connection
+
+
+class PyCalciteExecutionContext(default.DefaultExecutionContext):
+    def create_cursor(self):
+        # execution_options(timeout=seconds, deadline=time.time() value or datetime)
+        cursor = super(PyCalciteExecutionContext, self).create_cursor()
+        timeout = self.execution_options.get('timeout')
+        if timeout:
+            cursor.timeout = float(timeout)
+        deadline = self.execution_options.get('deadline')
+        if deadline is not None:
+            cursor.deadline = deadline.timestamp() if hasattr(deadline, 'timestamp') else float(deadline)
+        return cursor
+
+    def create_server_side_cursor(self):
+        # yield_per sets stream_results and max_row_buffer
+        fetch_size = self.execution_options.get('yield_per') or self.execution_options.get('max_row_buffer')
+        return self._dbapi_connection.cursor(streaming=True, fetch_size=fetch_size)
+
+
 class PyCalciteDialect(default.DefaultDialect):
     name = 'pycalcite'
     driver = 'pycalcite'
@@ -213,9 +270,29 @@ class PyCalciteDialect(default.DefaultDialect):
     description_encoding = None
     supports_multivalues_insert = True
     type_compiler = HiveTypeCompiler
+    execution_ctx_cls = PyCalciteExecutionContext
+    # compiled statements are cached per engine, see HiveCompiler
+    supports_statement_cache = True
+    # stream_results / yield_per hand out a pycalcite StreamingCursor
+    supports_server_side_cursors = True
 
     default_paramstyle = 'pyformat'
 
+    def __init__(self, metadata_cache_ttl=300, **kwargs):
+        super(PyCalciteDialect, self).__init__(**kwargs)
+        # reflected schemas, tables and columns per model, see invalidate_metadata()
+        self.metadata_cache = MetadataCache(metadata_cache_ttl)
+
+    def invalidate_metadata(self, fingerprint=None, schema=None):
+        self.metadata_cache.invalidate(fingerprint, schema)
+
+    def _table_index(self, connection_object, schema):
+        def load():
+            tables_list = connection_object.conn.getTablesMetaInfo(None, schema, None, ['TABLE'])
+            return TableIndex([str(table.getTableName()) for table in tables_list])
+
+        return self.metadata_cache.get((connection_object.fingerprint, 'tables', schema, None), load)
+
     @classmethod
     def dbapi(cls):
         return __import__('pycalcite')
@@ -238,15 +315,13 @@ class PyCalciteDialect(default.DefaultDialect):
     def get_schema_names(self, connection, **kw):
         # Equivalent to SHOW DATABASES
         # return [row[0] for row in connection.execute('SHOW SCHEMAS')]
-        # calcite_bridge = connection.connect().connection.connection.conn
-        connection_object = connection.raw_connection().connection
-        if connection_object.connection_closed():
-            connection_object.reconnect()
-        calcite_bridge = connection_object.conn
-        schemas_list = calcite_bridge.getSchemaMetaInfo(None, None)
-        result = [str(schema.getSchemaName()) for schema in schemas_list]
-        connection_object.close()
-        return result
+        with _calcite_connection(connection) as connection_object:
+            def load():
+                schemas_list = connection_object.conn.getSchemaMetaInfo(None, None)
+                return [str(schema.getSchemaName()) for schema in schemas_list]
+
+            key = (connection_object.fingerprint, 'schemas', None, None)
+            return list(self.metadata_cache.get(key, load))
 
     def get_view_names(self, connection, schema=None, **kw):
         # Hive does not provide functionality to query tableType
@@ -281,37 +356,82 @@ class PyCalciteDialect(default.DefaultDialect):
                 raise exc.NoSuchTableError(full_table)
             return rows
 
-    def has_table(self, connection, table_name, schema=None):
-        try:
-            calcite_bridge = connection.connection.connection.conn
-            tables_list = calcite_bridge.getTablesMetaInfo(None, None, table_name, ['TABLE'])
-            # rows = connection.execute('DESCRIBE {}'.format(table_name)).fetchall()
-            for table_info in tables_list:
-                if table_info.getTableName().toLowerCase() == table_name.lower():
-                    return True
-            return False
-        except exc.NoSuchTableError:
-            return False
+    def has_table(self, connection, table_name, schema=None, **kw):
+        with _calcite_connection(connection) as connection_object:
+            return table_name in self._table_index(connection_object, schema)
 
     def get_columns(self, connection, table_name, schema=None, **kw):
-        if isinstance(connection, Engine):
-            connection_object = connection.raw_connection().connection
-            if connection_object.connection_closed():
-                connection_object.reconnect()
-            calcite_bridge = connection_object.conn
-        else:
-            connection_object = None
-            calcite_bridge = connection.connection.connection.conn
-        columns_list = calcite_bridge.getTableColumnsMetaInfo(None, schema, table_name, None)
-        result = [{
-            'name': str(column.getColumnName()),
-            'type': _type_map.get(column.getColumnType().toLowerCase(), types.NullType),
-            'nullable': column.getNullable() != 0,
-            'default': None
-        } for column in columns_list]
-        if connection_object:
-            connection_object.close()
-        return result
+        with _calcite_connection(connection) as connection_object:
+            def load():
+                columns_list = connection_object.conn.getTableColumnsMetaInfo(None, schema, table_name, None)
+                tables = _columns_by_table(columns_list)
+                if table_name in tables:
+                    return tables[table_name]
+                # a case-insensitive lex reports the name as the model spells it
+                return next((columns for name, columns in tables.items() if name.lower() == table_name.lower()), [])
+
+            key = (connection_object.fingerprint, 'columns', schema, table_name)
+            return [dict(column) for column in self.metadata_cache.get(key, load)]
+
+    def _schema_columns(self, connection_object, schema):
+        """Columns of every table of ``schema`` from a single getTableColumnsMetaInfo() call
+
+        Also caches the columns of each table for get_columns().
+        """
+        fingerprint = connection_object.fingerprint
+
+        def load():
+            tables = _columns_by_table(connection_object.conn.getTableColumnsMetaInfo(None, schema, None, None))
+            for table_name, columns in tables.items():
+                self.metadata_cache.put((fingerprint, 'columns', schema, table_name), columns)
+            return tables
+
+        return self.metadata_cache.get((fingerprint, 'schema_columns', schema, None), load)
+
+    def _multi_reflect(self, connection, schema, filter_names, scope, kind, value):
+        # value(table_name) for the tables of schema, SQLAlchemy 2.0 multi reflection
+        if not _reflects_tables(scope, kind):
+            return []
+        with _calcite_connection(connection) as connection_object:
+            index = self._table_index(connection_object, schema)
+            names = index.names() if filter_names is None else [name for name in filter_names if name in index]
+        return [((schema, name), value(name)) for name in names]
+
+    def get_multi_columns(self, connection, schema=None, filter_names=None, scope=None, kind=None, **kw):
+        """Columns of many tables from one metadata round trip instead of one per table
+
+        Reports the tables of get_table_names() like the other multi
+        reflection hooks, not the views and metadata tables the column rows
+        also cover.
+        """
+        if not _reflects_tables(scope, kind):
+            return []
+        with _calcite_connection(connection) as connection_object:
+            index = self._table_index(connection_object, schema)
+            tables = self._schema_columns(connection_object, schema)
+        names = index.names() if filter_names is None else [name for name in filter_names if name in index]
+        return [((schema, name), [dict(column) for column in tables.get(index.get(name), ())]) for name in names]
+
+    def get_multi_pk_constraint(self, connection, schema=None, filter_names=None, scope=None, kind=None, **kw):
+        return self._multi_reflect(connection, schema, filter_names, scope, kind,
+                                   lambda name: {'constrained_columns': [], 'name': None})
+
+    def get_multi_foreign_keys(self, connection, schema=None, filter_names=None, scope=None, kind=None, **kw):
+        return self._multi_reflect(connection, schema, filter_names, scope, kind, lambda name: [])
+
+    def get_multi_indexes(self, connection, schema=None, filter_names=None, scope=None, kind=None, **kw):
+        return self._multi_reflect(connection, schema, filter_names, scope, kind, lambda name: [])
+
+    def get_multi_unique_constraints(self, connection, schema=None, filter_names=None, scope=None, kind=None,
+                                     **kw):
+        return self._multi_reflect(connection, schema, filter_names, scope, kind, lambda name: [])
+
+    def get_multi_check_constraints(self, connection, schema=None, filter_names=None, scope=None, kind=None,
+                                    **kw):
+        return self._multi_reflect(connection, schema, filter_names, scope, kind, lambda name: [])
+
+    def get_multi_table_comment(self, connection, schema=None, filter_names=None, scope=None, kind=None, **kw):
+        return self._multi_reflect(connection, schema, filter_names, scope, kind, lambda name: {'text': None})
 
     def get_columns_old(self, connection, table_name, schema=None, **kw):
         rows = self._get_table_columns(connection, table_name, schema)
@@ -360,19 +480,8 @@ class PyCalciteDialect(default.DefaultDialect):
             query += ' IN ' + self.identifier_preparer.quote_identifier(schema)
         return [row[0] for row in connection.execute(query)]
         """
-        if isinstance(connection, Engine):
-            connection_object = connection.raw_connection().connection
-            if connection_object.connection_closed():
-                connection_object.reconnect()
-            calcite_bridge = connection_object.conn
-        else:
-            connection_object = None
-            calcite_bridge = connection.connection.connection.conn
-        tables_list = calcite_bridge.getTablesMetaInfo(None, schema, None, ['TABLE'])
-        result = [str(table.getTableName()) for table in tables_list]
-        if connection_object:
-            connection_object.close()
-        return result
+        with _calcite_connection(connection) as connection_object:
+            return self._table_index(connection_object, schema).names()
 
     def do_rollback(self, dbapi_connection):
         # No transactions for Hive
@@ -0,0 +1,172 @@
+package com.fawvw.ms.bp.core;
+
+import java.sql.Date;
+import java.sql.ResultSet;
+import java.sql.SQLException;
+import java.sql.Time;
+import java.sql.Timestamp;
+import java.util.Calendar;
+import java.util.TimeZone;
+
+/**
+ * Drains rows of a {@link ResultSet} into one packed array per column, so that
+ * pycalcite moves a whole batch across JPype with a handful of calls instead
+ * of one call per cell.
+ *
+ * <p>Column kinds must stay in sync with {@code pycalcite.calcite4py}:
+ * integers are read as {@code long[]}, floating and decimal types as
+ * {@code double[]}, booleans as {@code boolean[]}, TIMESTAMP as epoch
+ * microseconds, DATE as epoch days and TIME as microseconds of the day
+ * (all {@code long[]}, wall clock read through a UTC calendar), BINARY as
+ * {@code byte[][]} and everything else as {@code String[]}.
+ */
+public final class RowBatchFetcher {
+    public static final int LONG = 0;
+    public static final int DOUBLE = 1;
+    public static final int BOOLEAN = 2;
+    public static final int STRING = 3;
+    public static final int TIMESTAMP = 4;
+    public static final int DATE = 5;
+    public static final int TIME = 6;
+    public static final int BYTES = 7;
+    public static final int OBJECT = 8;
+
+    private static final long MILLIS_PER_DAY = 86400000L;
+
+    private final ResultSet resultSet;
+    private final int[] kinds;
+    private final Calendar utc = Calendar.getInstance(TimeZone.getTimeZone("UTC"));
+    private Object[] columns;
+    private byte[][] nulls;
+
+    public RowBatchFetcher(ResultSet resultSet, int[] kinds) {
+        this.resultSet = resultSet;
+        this.kinds = (int[]) kinds.clone();
+    }
+
+    /**
+     * Reads up to {@code maxRows} rows into fresh column arrays and returns
+     * the number of rows read, 0 once the result set is exhausted.
+     */
+    public int fetch(int maxRows) throws SQLException {
+        columns = new Object[kinds.length];
+        nulls = new byte[kinds.length][];
+        for (int c = 0; c < kinds.length; c++) {
+            columns[c] = allocate(kinds[c], maxRows);
+            nulls[c] = new byte[maxRows];
+        }
+        int row = 0;
+        while (row < maxRows && resultSet.next()) {
+            for (int c = 0; c < kinds.length; c++) {
+                read(c, row);
+            }
+            row++;
+        }
+        return row;
+    }
+
+    public Object getColumn(int index) {
+        return columns[index];
+    }
+
+    public byte[] getNulls(int index) {
+        return nulls[index];
+    }
+
+    private static Object allocate(int kind, int size) {
+        switch (kind) {
+            case LONG:
+            case TIMESTAMP:
+            case DATE:
+            case TIME:
+                return new long[size];
+            case DOUBLE:
+                return new double[size];
+            case BOOLEAN:
+                return new boolean[size];
+            case BYTES:
+                return new byte[size][];
+            default:
+                return new String[size];
+        }
+    }
+
+    private void read(int c, int row) throws SQLException {
+        int index = c + 1;
+        switch (kinds[c]) {
+            case LONG: {
+                long value = resultSet.getLong(index);
+                if (resultSet.wasNull()) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((long[]) columns[c])[row] = value;
+                }
+                break;
+            }
+            case DOUBLE: {
+                double value = resultSet.getDouble(index);
+                if (resultSet.wasNull()) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((double[]) columns[c])[row] = value;
+                }
+                break;
+            }
+            case BOOLEAN: {
+                boolean value = resultSet.getBoolean(index);
+                if (resultSet.wasNull()) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((boolean[]) columns[c])[row] = value;
+                }
+                break;
+            }
+            case TIMESTAMP: {
+                Timestamp value = resultSet.getTimestamp(index, utc);
+                if (value == null) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((long[]) columns[c])[row] =
+                        Math.floorDiv(value.getTime(), 1000L) * 1000000L + value.getNanos() / 1000;
+                }
+                break;
+            }
+            case DATE: {
+                Date value = resultSet.getDate(index, utc);
+                if (value == null) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((long[]) columns[c])[row] = Math.floorDiv(value.getTime(), MILLIS_PER_DAY);
+                }
+                break;
+            }
+            case TIME: {
+                Time value = resultSet.getTime(index, utc);
+                if (value == null) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((long[]) columns[c])[row] = Math.floorMod(value.getTime(), MILLIS_PER_DAY) * 1000L;
+                }
+                break;
+            }
+            case BYTES: {
+                byte[] value = resultSet.getBytes(index);
+                if (value == null) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((byte[][]) columns[c])[row] = value;
+                }
+                break;
+            }
+            default: {
+                String value = resultSet.getString(index);
+                if (value == null) {
+                    nulls[c][row] = 1;
+                } else {
+                    ((String[]) columns[c])[row] = value;
+                }
+                break;
+            }
+        }
+    }
+}
@@ -0,0 +1,53 @@
+"""Compile RowBatchFetcher.java into ../row_batch_fetcher.jar
+
+Needs no JDK: the shipped Janino compiles the source inside any JVM JPype
+can start, resolving the JDK classes through reflection. The class file
+targets Java 6 and loads on every JVM dialect_calcite.jar runs on::
+
+    python pycalcite/jar/src/build_fetcher.py
+"""
+from __future__ import absolute_import
+
+import io
+import os
+import sys
+import zipfile
+
+import jpype
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+JAR_DIR = os.path.dirname(SRC_DIR)
+SOURCE = os.path.join(SRC_DIR, 'RowBatchFetcher.java')
+TARGET = os.path.join(JAR_DIR, 'row_batch_fetcher.jar')
+JANINO_JARS = [os.path.join(JAR_DIR, 'janino-3.0.11.jar'), os.path.join(JAR_DIR, 'commons-compiler-3.0.11.jar')]
+
+MANIFEST = 'Manifest-Version: 1.0\r\nCreated-By: pycalcite build_fetcher.py (Janino 3.0.11)\r\n\r\n'
+
+
+def compile_source(path):
+    """Return ``{class file name: bytes}`` of the classes of the Java source ``path``"""
+    parser = jpype.JClass('org.codehaus.janino.Parser')
+    scanner = jpype.JClass('org.codehaus.janino.Scanner')
+    unit_compiler = jpype.JClass('org.codehaus.janino.UnitCompiler')
+    class_loader = jpype.JClass('org.codehaus.janino.ClassLoaderIClassLoader')
+    with io.open(path, encoding='utf-8') as f:
+        reader = jpype.JClass('java.io.StringReader')(f.read())
+    unit = parser(scanner(path, reader)).parseCompilationUnit()
+    system_loader = jpype.JClass('java.lang.ClassLoader').getSystemClassLoader()
+    class_files = unit_compiler(unit, class_loader(system_loader)).compileUnit(True, True, False)
+    return dict((str(class_file.getThisClassName()).replace('.', '/') + '.class', bytes(class_file.toByteArray()))
+                for class_file in class_files)
+
+
+def main():
+    jpype.startJVM(jpype.getDefaultJVMPath(), '-Djava.class.path=%s' % os.pathsep.join(JANINO_JARS))
+    classes = compile_source(SOURCE)
+    with zipfile.ZipFile(TARGET, 'w', zipfile.ZIP_DEFLATED) as jar:
+        jar.writestr('META-INF/MANIFEST.MF', MANIFEST)
+        for name in sorted(classes):
+            jar.writestr(name, classes[name])
+    sys.stdout.write('%s: %s\n' % (TARGET, ', '.join(sorted(classes))))
+
+
+if __name__ == '__main__':
+    main()
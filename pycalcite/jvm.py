@@ -0,0 +1,309 @@
+from __future__ import absolute_import
+
+import copy
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+import zipfile
+
+import jpype
+
+from .log import logger
+
+JAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jar')
+DIALECT_JAR = os.path.join(JAR_DIR, 'dialect_calcite.jar')
+# RowBatchFetcher of Cursor.fetch_batch(), built by jar/src/build_fetcher.py
+FETCHER_JAR = os.path.join(JAR_DIR, 'row_batch_fetcher.jar')
+# extra JVM flags for jobs that cannot call configure_JVM(), e.g. '-Xmx2g -XX:+UseSerialGC'
+JVM_ARGS_ENV = 'PYCALCITE_JVM_ARGS'
+# directory of the thin copy of dialect_calcite.jar, see thin_dialect_jar()
+CACHE_DIR_ENV = 'PYCALCITE_CACHE_DIR'
+
+# jars every model needs: Calcite itself and what its planner and code
+# generation load, by artifact name
+_CORE_JARS = (
+    'calcite-core', 'calcite-linq4j', 'avatica-core', 'avatica-metrics',
+    'guava', 'failureaccess', 'jackson-annotations', 'jackson-core', 'jackson-databind',
+    'janino', 'commons-compiler', 'commons-lang3', 'commons-codec', 'esri-geometry-api',
+    'jackson-dataformat-yaml', 'snakeyaml',
+    'json-path', 'json-smart', 'accessors-smart', 'asm', 'slf4j-api', 'protobuf-java',
+    'sketches-core', 'memory', 'aggdesigner-algorithm', 'uzaygezen-core',
+    'checker-qual', 'jsr305', 'apiguardian-api',
+)
+
+_HTTP_JARS = ('httpclient', 'httpcore', 'commons-logging')
+
+# schema factory class -> jars of its adapter
+_FACTORY_JARS = {
+    'com.fawvw.ms.bp.core.dialect.CsvSchemaFactory': (),
+    'com.fawvw.ms.bp.core.dialect.MySQLSchemaFactory': ('mysql-connector-java',),
+    # the Hive JDBC driver is not shipped, it comes from CLASSPATH
+    'com.fawvw.ms.bp.core.dialect.HiveSchemaFactory': (),
+    'org.apache.calcite.adapter.csv.CsvSchemaFactory': ('calcite-example-csv', 'opencsv', 'commons-io'),
+    'org.apache.calcite.adapter.elasticsearch.ElasticsearchSchemaFactory':
+        ('calcite-elasticsearch', 'elasticsearch-rest-client', 'httpasyncclient', 'httpcore-nio') + _HTTP_JARS,
+}
+
+# JDBC driver class prefix -> jars of the driver, for "type": "jdbc" schemas
+_DRIVER_JARS = {
+    'com.mysql.': ('mysql-connector-java',),
+    'ru.yandex.clickhouse.': ('clickhouse-jdbc', 'lz4', 'httpmime') + _HTTP_JARS,
+    'com.clickhouse.': ('clickhouse-jdbc', 'lz4', 'httpmime') + _HTTP_JARS,
+}
+
+_JDBC_SCHEMA_JARS = ('commons-dbcp2', 'commons-pool2')
+
+_GC_FLAGS = {
+    'serial': '-XX:+UseSerialGC',
+    'parallel': '-XX:+UseParallelGC',
+    'g1': '-XX:+UseG1GC',
+    'z': '-XX:+UseZGC',
+}
+
+
+def _find_jars(artifacts, jar_dir=JAR_DIR):
+    """Paths of the ``<artifact>-<version>.jar`` files of ``jar_dir``, in ``artifacts`` order"""
+    try:
+        files = sorted(os.listdir(jar_dir))
+    except OSError:
+        return []
+    paths = []
+    for artifact in artifacts:
+        pattern = re.compile(r'^%s-\d[^/]*\.jar$' % re.escape(artifact))
+        paths.extend(os.path.join(jar_dir, name) for name in files if pattern.match(name))
+    return paths
+
+
+def _strip_class_path(manifest):
+    lines = []
+    in_class_path = False
+    for line in manifest.splitlines():
+        # continuation lines start with a space
+        if line.startswith(' ') and in_class_path:
+            continue
+        in_class_path = line.startswith('Class-Path:')
+        if not in_class_path:
+            lines.append(line)
+    return '\r\n'.join(lines).rstrip() + '\r\n\r\n'
+
+
+def thin_dialect_jar(cache_dir=None):
+    """Copy of dialect_calcite.jar whose manifest has no Class-Path
+
+    The Class-Path of the shipped manifest puts every jar of the jar
+    directory on the classpath, whatever the -Djava.class.path. The copy is
+    written once per version of the jar to ``cache_dir``
+    (PYCALCITE_CACHE_DIR or ~/.cache/pycalcite); returns None if it cannot
+    be written.
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV) or os.path.join(os.path.expanduser('~'), '.cache',
+                                                                            'pycalcite')
+    stat = os.stat(DIALECT_JAR)
+    path = os.path.join(cache_dir, 'dialect_calcite-thin-%d-%d.jar' % (stat.st_size, int(stat.st_mtime)))
+    if os.path.isfile(path):
+        return path
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        with zipfile.ZipFile(DIALECT_JAR) as source, zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as thin:
+            for info in source.infolist():
+                data = source.read(info)
+                if info.filename == 'META-INF/MANIFEST.MF':
+                    data = _strip_class_path(data.decode('utf-8')).encode('utf-8')
+                thin.writestr(info, data)
+        os.replace(temp_path, path)
+    except (OSError, IOError, zipfile.BadZipfile) as ex:
+        logger.debug('cannot write the thin dialect jar to %s: %s' % (cache_dir, ex))
+        return None
+    logger.debug('thin dialect jar written to %s' % path)
+    return path
+
+
+def resolve_classpath(json_str, jar_dir=JAR_DIR):
+    """Return the jars a model JSON needs, followed by a thin dialect_calcite.jar
+
+    Only the jars of Calcite and of the adapters and JDBC drivers used by
+    the model are listed; thin_dialect_jar() keeps the manifest of the
+    dialect jar from adding the others (lombok, clickhouse, ...) back. A
+    model with a schema factory or JDBC driver this resolver does not know,
+    or a thin jar that cannot be written, gets the full dialect jar and with
+    it every shipped jar.
+    """
+    try:
+        model = json.loads(json_str) if isinstance(json_str, str) else json_str
+    except ValueError:
+        logger.debug('model is not JSON, using the full classpath')
+        return [DIALECT_JAR]
+    artifacts = list(_CORE_JARS)
+    for schema in model.get('schemas', ()):
+        if schema.get('type') == 'jdbc':
+            driver = schema.get('jdbcDriver', '')
+            prefixes = [prefix for prefix in _DRIVER_JARS if driver.startswith(prefix)]
+            if not prefixes:
+                logger.debug('unknown JDBC driver %s, using the full classpath' % driver)
+                return [DIALECT_JAR]
+            artifacts.extend(_JDBC_SCHEMA_JARS + _DRIVER_JARS[prefixes[0]])
+        elif schema.get('factory'):
+            if schema['factory'] not in _FACTORY_JARS:
+                logger.debug('unknown schema factory %s, using the full classpath' % schema['factory'])
+                return [DIALECT_JAR]
+            artifacts.extend(_FACTORY_JARS[schema['factory']])
+    thin_jar = thin_dialect_jar()
+    if thin_jar is None:
+        return [DIALECT_JAR]
+    seen = set()
+    artifacts = [name for name in artifacts if not (name in seen or seen.add(name))]
+    return _find_jars(artifacts, jar_dir) + [thin_jar]
+
+
+class JVMOptions(object):
+    """JVM flags startup_JVM passes besides the classpath
+
+    ``max_heap`` and ``initial_heap`` take java sizes ('512m', '4g'), ``gc``
+    one of 'serial', 'parallel', 'g1' or 'z', and ``quick_jit`` stops tiered
+    compilation at C1, which warms up faster but peaks lower. An existing
+    ``cds_archive`` built by build_cds_archive() is mapped at startup, with
+    ``minimal_classpath`` the classpath comes from resolve_classpath() and
+    ``extra_args`` are appended as they are.
+    """
+
+    def __init__(self, max_heap=None, initial_heap=None, gc=None, quick_jit=False, cds_archive=None,
+                 minimal_classpath=False, extra_args=None):
+        if gc is not None and gc not in _GC_FLAGS:
+            raise ValueError('unknown gc %r, expected one of %s' % (gc, ', '.join(sorted(_GC_FLAGS))))
+        self.max_heap = max_heap
+        self.initial_heap = initial_heap
+        self.gc = gc
+        self.quick_jit = quick_jit
+        self.cds_archive = cds_archive
+        self.minimal_classpath = minimal_classpath
+        self.extra_args = list(extra_args or ())
+
+    @classmethod
+    def short_lived(cls, **kwargs):
+        """Profile for CLI jobs and workers living for a few queries"""
+        kwargs.setdefault('gc', 'serial')
+        kwargs.setdefault('quick_jit', True)
+        kwargs.setdefault('minimal_classpath', True)
+        # no hsperfdata file to create and map
+        kwargs.setdefault('extra_args', ['-XX:-UsePerfData'])
+        return cls(**kwargs)
+
+    def to_args(self):
+        args = []
+        if self.initial_heap:
+            args.append('-Xms%s' % self.initial_heap)
+        if self.max_heap:
+            args.append('-Xmx%s' % self.max_heap)
+        if self.gc:
+            args.append(_GC_FLAGS[self.gc])
+        if self.quick_jit:
+            args.append('-XX:TieredStopAtLevel=1')
+        if self.cds_archive:
+            if os.path.isfile(self.cds_archive):
+                args.extend(['-Xshare:auto', '-XX:SharedArchiveFile=%s' % self.cds_archive])
+            else:
+                logger.debug('CDS archive %s does not exist, starting without it' % self.cds_archive)
+        args.extend(self.extra_args)
+        args.extend(shlex.split(os.environ.get(JVM_ARGS_ENV, '')))
+        return args
+
+    def classpath(self, json_str):
+        if self.minimal_classpath:
+            return [FETCHER_JAR] + resolve_classpath(json_str)
+        return [FETCHER_JAR, DIALECT_JAR]
+
+
+_options = JVMOptions()
+
+
+def configure_JVM(options=None, **kwargs):
+    """Set the JVMOptions of the next JVM start, as an instance or JVMOptions arguments
+
+    The JVM starts once per process, with the first connection; options set
+    afterwards are kept but do not apply.
+    """
+    global _options
+    _options = options if options is not None else JVMOptions(**kwargs)
+    if jpype.isJVMStarted():
+        logger.warn('the JVM is already running, the new JVM options apply to the next process only')
+    return _options
+
+
+def get_JVM_options():
+    return _options
+
+
+def warm_up(connection, sql=None, repeat=3):
+    """Run a warm-up query ``repeat`` times on a pycalcite connection
+
+    The first query loads the parser, planner and Janino code generation
+    classes and the next ones let the JIT compile them. Returns the elapsed
+    seconds of each run.
+    """
+    from .cache import NO_CACHE_HINT
+    sql = '%s %s' % (NO_CACHE_HINT, sql or 'VALUES 1')
+    timings = []
+    cursor = connection.cursor()
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            cursor.execute(sql)
+            cursor.fetchall()
+            timings.append(time.time() - start)
+    finally:
+        cursor.close()
+    logger.debug('warm-up query took %s' % ', '.join('%.3fs' % t for t in timings))
+    return timings
+
+
+def build_cds_archive(archive_path, con_json_dict, warmup_sql=None, options=None, timeout=600):
+    """Write an AppCDS archive of the classes a model loads to ``archive_path``
+
+    A child interpreter starts the JVM with ``-XX:ArchiveClassesAtExit``
+    (JDK 13+), opens a connection on ``con_json_dict`` and runs warm_up()
+    with ``warmup_sql``; the JVM dumps the classes it loaded when it exits.
+    Pass ``JVMOptions(cds_archive=archive_path)`` with the same classpath
+    options to configure_JVM() to start from the archive.
+    """
+    from .calcite4py import OperationalError
+    options = copy.deepcopy(options or _options)
+    options.cds_archive = None
+    options.extra_args.append('-XX:ArchiveClassesAtExit=%s' % os.path.abspath(archive_path))
+    spec = json.dumps(dict(options=options.__dict__, con_json_dict=con_json_dict, warmup_sql=warmup_sql))
+    process = subprocess.Popen([sys.executable, '-m', 'pycalcite.jvm'], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        out, err = process.communicate(spec.encode('utf-8'), timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise OperationalError('building the CDS archive timed out after %ss' % timeout)
+    if process.returncode != 0 or not os.path.isfile(archive_path):
+        raise OperationalError('building the CDS archive failed (exit code %s): %s'
+                               % (process.returncode, err.decode('utf-8', 'replace')[-2000:]))
+    logger.debug('CDS archive written to %s' % archive_path)
+    return archive_path
+
+
+def _dump_archive(spec):
+    from .calcite4py import stop_JVM
+    from .connection import connect
+    configure_JVM(JVMOptions(**spec['options']))
+    conn = connect(con_json_dict=spec['con_json_dict'], use_bridge_pool=False)
+    try:
+        warm_up(conn, spec.get('warmup_sql'))
+    finally:
+        conn.close()
+    stop_JVM()
+
+
+if __name__ == '__main__':
+    # run with -m this module is __main__, configure the pycalcite.jvm the connections read
+    from pycalcite import jvm
+    jvm._dump_archive(json.loads(sys.stdin.read()))
@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TableIndex(object):
+    """Table names of a schema, indexed by lower-cased name for lookups"""
+
+    def __init__(self, names):
+        self._names = OrderedDict((name.lower(), name) for name in names)
+
+    def __contains__(self, name):
+        return name.lower() in self._names
+
+    def __iter__(self):
+        return iter(self._names.values())
+
+    def __len__(self):
+        return len(self._names)
+
+    def names(self):
+        return list(self._names.values())
+
+    def get(self, name):
+        return self._names.get(name.lower())
+
+
+class MetadataCache(object):
+    """TTL cache of reflected metadata, scoped per model fingerprint and schema
+
+    Entries are keyed ``(fingerprint, kind, schema, name)`` and expire
+    ``ttl`` seconds after they were loaded; a ttl of 0 disables caching.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """Return the cached value of ``key``, calling ``loader()`` to (re)load it"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+
+    def invalidate(self, fingerprint=None, schema=None):
+        """Drop the entries of a model fingerprint and/or schema, or all of them"""
+        with self._lock:
+            if fingerprint is None and schema is None:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if fingerprint is not None and key[0] != fingerprint:
+                    continue
+                if schema is not None and key[2] != schema:
+                    continue
+                del self._entries[key]
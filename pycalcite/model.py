@@ -0,0 +1,346 @@
+"""Typed builder of the Calcite model passed to connections as ``con_json_dict``
+
+Besides the schemas, the model declares the materializations and lattices
+Calcite's planner uses to rewrite queries against pre-computed tables::
+
+    model = Model(default_schema='HIVE')
+    model.add_schema(hive_schema('HIVE', 'jdbc:hive2://host:10000/db', 'user', 'pwd'))
+    agg = model.add_schema(MapSchema('AGG'))
+    agg.add_lattice(Lattice('SALES', 'SELECT * FROM HIVE.SALES s JOIN HIVE.STORES t ON s.STORE_ID = t.ID',
+                            tiles=[Tile(['t.REGION', 's.DAY'], [Measure('sum', 'AMOUNT'), Measure('count')])]))
+    conn = model.connect()
+
+Calcite's planner only uses them on connections with the
+``materializationsEnabled`` property, which CalciteBridge leaves at its
+default of false; Model.connect() turns it on for models declaring any,
+other connections pass ``materializations_enabled=True`` to connect().
+Process isolated connections do not support it.
+
+Calcite populates materializations and tiles when a bridge loads the
+model; Model.refresh() (or a ModelRefresher) makes the next connections
+load them again. Model.explain() tells which of them a query reads.
+"""
+from __future__ import absolute_import
+
+import json
+import random
+import re
+import threading
+
+from .log import logger
+from .pool import fingerprint
+
+CSV_FACTORY = 'com.fawvw.ms.bp.core.dialect.CsvSchemaFactory'
+MYSQL_FACTORY = 'com.fawvw.ms.bp.core.dialect.MySQLSchemaFactory'
+HIVE_FACTORY = 'com.fawvw.ms.bp.core.dialect.HiveSchemaFactory'
+
+# table=[[SCHEMA, TABLE]] of the scans of an EXPLAIN PLAN output
+_SCAN_RE = re.compile(r'table=\[\[([^\]]*)\]\]')
+# Calcite names the tables of lattice tiles after their columns, m{1, 4}
+_TILE_PREFIX = 'm{'
+
+
+class Measure(object):
+    """Aggregate function ``agg`` of a lattice tile over the columns ``args``"""
+
+    def __init__(self, agg, args=None):
+        self.agg = agg
+        self.args = [args] if isinstance(args, str) else list(args or ())
+
+    def to_dict(self):
+        measure = dict(agg=self.agg)
+        if self.args:
+            measure['args'] = self.args
+        return measure
+
+
+class Tile(object):
+    """Pre-aggregated tile of a lattice, grouped by ``dimensions``"""
+
+    def __init__(self, dimensions, measures=()):
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+
+    def to_dict(self):
+        return dict(dimensions=self.dimensions, measures=[measure.to_dict() for measure in self.measures])
+
+
+class Lattice(object):
+    """Star query ``sql`` whose aggregates Calcite answers from tiles
+
+    With ``auto`` Calcite creates tiles for the queries it sees, with
+    ``algorithm`` it picks tiles up front, spending at most
+    ``algorithm_max_millis``; ``tiles`` are created in any case.
+    """
+
+    def __init__(self, name, sql, tiles=(), default_measures=(), auto=True, algorithm=False,
+                 algorithm_max_millis=None, row_count_estimate=None):
+        self.name = name
+        self.sql = sql
+        self.tiles = list(tiles)
+        self.default_measures = list(default_measures)
+        self.auto = auto
+        self.algorithm = algorithm
+        self.algorithm_max_millis = algorithm_max_millis
+        self.row_count_estimate = row_count_estimate
+
+    def to_dict(self):
+        lattice = dict(name=self.name, sql=self.sql, auto=self.auto, algorithm=self.algorithm)
+        if self.tiles:
+            lattice['tiles'] = [tile.to_dict() for tile in self.tiles]
+        if self.default_measures:
+            lattice['defaultMeasures'] = [measure.to_dict() for measure in self.default_measures]
+        if self.algorithm_max_millis is not None:
+            lattice['algorithmMaxMillis'] = self.algorithm_max_millis
+        if self.row_count_estimate is not None:
+            lattice['rowCountEstimate'] = self.row_count_estimate
+        return lattice
+
+
+class Materialization(object):
+    """Table ``table`` populated with the result of ``sql``, optionally exposed as view ``view``"""
+
+    def __init__(self, table, sql, view=None):
+        self.table = table
+        self.sql = sql
+        self.view = view
+
+    def to_dict(self):
+        materialization = dict(table=self.table, sql=self.sql)
+        if self.view:
+            materialization['view'] = self.view
+        return materialization
+
+
+class Schema(object):
+    """Base of the schemas of a Model, holding its materializations and lattices
+
+    Their tables are created in this schema; a MapSchema of their own keeps
+    them apart from the tables of the source schemas.
+    """
+    type = None
+
+    def __init__(self, name, materializations=(), lattices=()):
+        self.name = name
+        self.materializations = list(materializations)
+        self.lattices = list(lattices)
+
+    def add_materialization(self, materialization):
+        self.materializations.append(materialization)
+        return materialization
+
+    def add_lattice(self, lattice):
+        self.lattices.append(lattice)
+        return lattice
+
+    def to_dict(self):
+        schema = dict(name=self.name, type=self.type)
+        if self.materializations:
+            schema['materializations'] = [m.to_dict() for m in self.materializations]
+        if self.lattices:
+            schema['lattices'] = [lattice.to_dict() for lattice in self.lattices]
+        return schema
+
+
+class MapSchema(Schema):
+    """Schema without tables of its own, the usual home of materializations and lattices"""
+    type = 'map'
+
+
+class CustomSchema(Schema):
+    """Schema built by the SchemaFactory class ``factory`` from ``operand``"""
+    type = 'custom'
+
+    def __init__(self, name, factory, operand=None, **kwargs):
+        super(CustomSchema, self).__init__(name, **kwargs)
+        self.factory = factory
+        self.operand = dict(operand or {})
+
+    def to_dict(self):
+        schema = super(CustomSchema, self).to_dict()
+        schema['factory'] = self.factory
+        schema['operand'] = self.operand
+        return schema
+
+
+def csv_schema(name, files_dir, file_names, **kwargs):
+    """CSV files ``file_names`` of ``files_dir``, every column read as VARCHAR"""
+    return CustomSchema(name, CSV_FACTORY, dict(files_dir=files_dir, file_names='!'.join(file_names)), **kwargs)
+
+
+def mysql_schema(name, url, user, password, table=None, driver='com.mysql.jdbc.Driver', **kwargs):
+    operand = dict(jdbcDriver=driver, jdbcUrl=url, jdbcUser=user, jdbcPassword=password)
+    if table:
+        operand['table'] = table
+    return CustomSchema(name, MYSQL_FACTORY, operand, **kwargs)
+
+
+def hive_schema(name, url, user, password, driver='org.apache.hive.jdbc.HiveDriver', operand=None, **kwargs):
+    """Hive tables over JDBC; ``operand`` adds factory options such as the Kerberos ones"""
+    hive_operand = dict(jdbcDriver=driver, jdbcUrl=url, jdbcUser=user, jdbcPassword=password)
+    hive_operand.update(operand or {})
+    return CustomSchema(name, HIVE_FACTORY, hive_operand, **kwargs)
+
+
+class MaterializationUsage(object):
+    """Materialized tables and lattice tiles read by the plan of ``sql``
+
+    ``tables`` lists ``(schema, table)`` pairs; ``used`` is true when the
+    planner rewrote the query against at least one of them.
+    """
+
+    def __init__(self, sql, plan, tables):
+        self.sql = sql
+        self.plan = plan
+        self.tables = tables
+
+    @property
+    def used(self):
+        return bool(self.tables)
+
+    def __repr__(self):
+        return '<MaterializationUsage used=%s tables=%r>' % (self.used, self.tables)
+
+
+class Model(object):
+    """Calcite model: schemas plus the connection level ``default_schema`` and ``lex``"""
+
+    def __init__(self, schemas=(), default_schema=None, lex='MYSQL'):
+        self.schemas = list(schemas)
+        self.default_schema = default_schema
+        self.lex = lex
+
+    def add_schema(self, schema):
+        self.schemas.append(schema)
+        return schema
+
+    def to_dict(self):
+        """The ``con_json_dict`` of the connections on this model"""
+        model = dict(version='1.0', schemas=[schema.to_dict() for schema in self.schemas], lex=self.lex)
+        if self.default_schema:
+            model['defaultSchema'] = self.default_schema
+        return model
+
+    @property
+    def fingerprint(self):
+        """The fingerprint of the connections on this model, see Connection"""
+        model = self.to_dict()
+        lex = model.pop('lex')
+        return fingerprint(json.dumps(model), lex)
+
+    def connect(self, **kwargs):
+        """Open a connection on this model, see pycalcite.connect() for ``kwargs``
+
+        The planner uses the materializations and lattices of the model
+        unless ``materializations_enabled=False`` is passed.
+        """
+        from .connection import connect
+        if any(schema.materializations or schema.lattices for schema in self.schemas):
+            kwargs.setdefault('materializations_enabled', True)
+        return connect(con_json_dict=self.to_dict(), **kwargs)
+
+    def refresh(self, result_cache=None, engines=(), clear_materializations=False):
+        """Make the connections on this model load its materializations and tiles again
+
+        Idle pooled bridges are closed, and a connection holding a bridge of
+        the model switches to a new one on its next cursor(), which closes
+        its open cursors. Results of ``result_cache``
+        (cache.default_result_cache by default) and the reflected metadata
+        of the SQLAlchemy ``engines`` are dropped.
+
+        Calcite keeps the tables it populated in the process wide
+        MaterializationService after their connection closed;
+        ``clear_materializations`` empties it, which also takes the
+        materializations of the other models away from their open
+        connections until they reconnect.
+        """
+        from .cache import default_result_cache
+        from .connection import bridge_pool
+        key = self.fingerprint
+        bridge_pool.invalidate(key)
+        if clear_materializations:
+            import jpype
+            if jpype.isJVMStarted():
+                jpype.JClass('org.apache.calcite.materialize.MaterializationService').instance().clear()
+        (result_cache or default_result_cache).invalidate(key)
+        for engine in engines:
+            engine.dialect.invalidate_metadata(key)
+        logger.debug('refreshed model %s' % key)
+
+    def _materialized_tables(self):
+        tables = set()
+        lattice_schemas = set()
+        for schema in self.schemas:
+            for materialization in schema.materializations:
+                tables.add((schema.name, materialization.table))
+            if schema.lattices:
+                lattice_schemas.add(schema.name)
+        return tables, lattice_schemas
+
+    def explain(self, connection, sql, parameters=None):
+        """Plan ``sql`` on ``connection`` and return the MaterializationUsage of the plan"""
+        from .calcite4py import Cursor
+        cursor = Cursor(connection)
+        try:
+            cursor.execute('EXPLAIN PLAN FOR %s' % sql, parameters)
+            plan = '\n'.join(str(row[0]) for row in cursor.fetchall())
+        finally:
+            cursor.close()
+        tables, lattice_schemas = self._materialized_tables()
+        schemas = set(schema for schema, _ in tables) | lattice_schemas
+        used = []
+        for match in _SCAN_RE.finditer(plan):
+            # tile names hold commas, split the schema off by name
+            schema, _, table = match.group(1).partition(', ')
+            if schema not in schemas:
+                continue
+            if (schema, table) in tables or (schema in lattice_schemas and table.startswith(_TILE_PREFIX)):
+                if (schema, table) not in used:
+                    used.append((schema, table))
+        return MaterializationUsage(sql, plan, used)
+
+    def report_usage(self, callback, sample_rate=0.01):
+        """Call ``callback(usage)`` with the MaterializationUsage of a sample of the queries run on this model
+
+        A sampled query is planned a second time for its EXPLAIN PLAN, in
+        the thread that ran it; ``sample_rate`` is the fraction of the
+        queries sampled, 1.0 to report all of them while measuring. Queries
+        with parameters and results of the result cache are skipped. Returns
+        the profiling hook, to be passed to profiling.unregister_hook().
+        """
+        from .profiling import register_hook
+        key = self.fingerprint
+
+        def hook(event, cursor, stats):
+            if event != 'execute' or random.random() >= sample_rate or stats.sql.lstrip()[:7].upper() == 'EXPLAIN':
+                return
+            conn = cursor._conn
+            # stats.plan is only measured for prepared statements, i.e. with parameters
+            if conn is None or getattr(conn, 'fingerprint', None) != key or stats.cache_hit or stats.plan is not None:
+                return
+            callback(self.explain(conn, stats.sql))
+
+        return register_hook(hook)
+
+
+class ModelRefresher(threading.Thread):
+    """Call ``model.refresh(**kwargs)`` every ``interval`` seconds until stop()"""
+
+    def __init__(self, model, interval, **kwargs):
+        super(ModelRefresher, self).__init__(name='pycalcite-model-refresh')
+        self.daemon = True
+        self.model = model
+        self.interval = interval
+        self._kwargs = kwargs
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.model.refresh(**self._kwargs)
+            except Exception as ex:
+                logger.debug('refreshing model failed: %s' % ex)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
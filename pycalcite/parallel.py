@@ -0,0 +1,37 @@
+from __future__ import absolute_import
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .calcite4py import attach_JVM_thread
+from .connection import Connection
+
+
+def _run_query(sql, parameters, connect_kwargs):
+    attach_JVM_thread()
+    conn = Connection(**connect_kwargs)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, parameters)
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def execute_many_parallel(queries, max_workers=None, **connect_kwargs):
+    """Run independent queries concurrently and return their rows in query order
+
+    ``queries`` holds SQL strings or ``(sql, parameters)`` pairs. Each query
+    gets its own Connection opened with ``connect_kwargs`` (so its own pooled
+    CalciteBridge) on a JVM-attached worker thread; JNI calls release the GIL,
+    so the queries run in parallel inside the JVM. Once every query has
+    finished, the error of the first failed query, if any, is raised.
+    """
+    queries = [(query, None) if isinstance(query, str) else tuple(query) for query in queries]
+    if not queries:
+        return []
+    workers = min(max_workers or len(queries), len(queries))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pycalcite-parallel',
+                            initializer=attach_JVM_thread) as executor:
+        futures = [executor.submit(_run_query, sql, parameters, connect_kwargs) for sql, parameters in queries]
+        # leaving the with block waits for every query, failed or not
+    return [future.result() for future in futures]
@@ -0,0 +1,155 @@
+from __future__ import absolute_import
+
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
+from .log import logger
+
+
+def fingerprint(json_str, lex='MYSQL'):
+    """Identify a model JSON and lex pair regardless of the key order of the JSON"""
+    try:
+        canonical = json.dumps(json.loads(json_str), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        canonical = json_str
+    return hashlib.sha1(('%s|%s' % (lex, canonical)).encode('utf-8')).hexdigest()
+
+
+def _is_healthy(bridge):
+    try:
+        stmt = bridge.createStatement()
+        try:
+            return not stmt.getConnection().isClosed()
+        finally:
+            stmt.close()
+    except Exception as ex:
+        logger.debug('bridge health check failed: %s' % ex)
+        return False
+
+
+def _close_bridge(bridge):
+    try:
+        bridge.close()
+    except Exception as ex:
+        logger.debug('closing bridge failed: %s' % ex)
+
+
+class BridgePool(object):
+    """Process wide pool of warm CalciteBridge instances keyed by model fingerprint
+
+    Building a CalciteBridge parses the model JSON and builds every sub-schema,
+    so released bridges are kept per fingerprint and handed out again. Up to
+    ``max_size`` idle bridges are kept per fingerprint, bridges idle for more
+    than ``idle_timeout`` seconds are closed except for the ``min_size`` most
+    recently used ones, and with ``health_check`` an idle bridge is checked
+    before it is handed out. invalidate() retires the bridges of a key, also
+    those checked out, whose connections then open a new one.
+    """
+
+    def __init__(self, factory, min_size=0, max_size=4, idle_timeout=300, health_check=True):
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._in_use = {}
+        # bumped by invalidate(), bridges of an older generation are not reused
+        self._generations = {}
+        self._counters = dict(created=0, reused=0, released=0, discarded=0, evicted=0, failed_checks=0)
+
+    def configure(self, **kwargs):
+        for name in ('min_size', 'max_size', 'idle_timeout', 'health_check'):
+            if name in kwargs:
+                setattr(self, name, kwargs.pop(name))
+        if kwargs:
+            raise TypeError('unexpected pool options: %s' % ', '.join(sorted(kwargs)))
+
+    def acquire(self, key, json_str, lex='MYSQL'):
+        """Check out a bridge for ``key``, building one from ``json_str`` if none is idle"""
+        while True:
+            with self._lock:
+                expired = self._pop_expired()
+                idle = self._idle.get(key)
+                bridge = idle.pop()[0] if idle else None
+            for stale in expired:
+                _close_bridge(stale)
+            if bridge is None:
+                break
+            if not self.health_check or _is_healthy(bridge):
+                with self._lock:
+                    self._counters['reused'] += 1
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                return bridge
+            with self._lock:
+                self._counters['failed_checks'] += 1
+            _close_bridge(bridge)
+        bridge = self._factory(json_str, lex)
+        with self._lock:
+            self._counters['created'] += 1
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        return bridge
+
+    def release(self, key, bridge, discard=False):
+        """Return a bridge checked out for ``key``; ``discard`` closes it instead"""
+        with self._lock:
+            if self._in_use.get(key):
+                self._in_use[key] -= 1
+            idle = self._idle.setdefault(key, deque())
+            keep = not discard and len(idle) < self.max_size
+            if keep:
+                idle.append((bridge, time.time()))
+                self._counters['released'] += 1
+            else:
+                self._counters['discarded'] += 1
+        if not keep:
+            _close_bridge(bridge)
+
+    def clear(self, key=None):
+        """Close the idle bridges of ``key``, or of every key"""
+        with self._lock:
+            keys = [key] if key is not None else list(self._idle)
+            bridges = [entry[0] for k in keys for entry in self._idle.pop(k, ())]
+            self._counters['evicted'] += len(bridges)
+        for bridge in bridges:
+            _close_bridge(bridge)
+
+    def generation(self, key):
+        """Incremented by every invalidate() of ``key``, see Connection.cursor()"""
+        return self._generations.get(key, 0)
+
+    def invalidate(self, key):
+        """Close the idle bridges of ``key`` and have the checked out ones closed once released"""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            bridges = [entry[0] for entry in self._idle.pop(key, ())]
+            self._counters['evicted'] += len(bridges)
+        for bridge in bridges:
+            _close_bridge(bridge)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['idle'] = sum(len(idle) for idle in self._idle.values())
+            stats['in_use'] = sum(self._in_use.values())
+            stats['keys'] = len(self._idle)
+        return stats
+
+    def _pop_expired(self):
+        # callers hold self._lock and close the returned bridges once they
+        # released it; idle deques are ordered by release time
+        deadline = time.time() - self.idle_timeout
+        expired = []
+        for key, idle in list(self._idle.items()):
+            while len(idle) > self.min_size and idle[0][1] < deadline:
+                expired.append(idle.popleft()[0])
+            if not idle and not self._in_use.get(key):
+                del self._idle[key]
+        if expired:
+            self._counters['evicted'] += len(expired)
+            logger.debug('evicting %d idle bridges' % len(expired))
+        return expired
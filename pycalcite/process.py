@@ -0,0 +1,416 @@
+from __future__ import absolute_import
+
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from .log import logger
+from .calcite4py import Cursor, Error, DatabaseError, OperationalError, NotSupportedError
+from . import calcite4py
+from .cache import CachedResult
+from .codec import _column_code, _decode_column, encode_rows
+from .pool import fingerprint
+from .profiling import HOOKS, QueryStats, emit
+
+
+def write_columns(columns, rows):
+    """Copy ``rows`` column by column into a new SharedMemory block
+
+    Returns ``(name, layout)``; the reader owns the block and unlinks it,
+    see read_columns.
+    """
+    codes = [_column_code(column[2]) for column in columns]
+    parts = []
+    layout = []
+    offset = 0
+    for code, (nulls, data) in zip(codes, encode_rows(codes, rows)):
+        layout.append((code, offset, offset + len(nulls), len(data)))
+        parts.extend((nulls, data))
+        offset += len(nulls) + len(data)
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        position = 0
+        for part in parts:
+            block.buf[position:position + len(part)] = part
+            position += len(part)
+    finally:
+        block.close()
+    # hand the block over to the reader, whose unlink() unregisters it
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block.name, layout
+
+
+def read_columns(name, layout, num_rows):
+    """Rebuild the rows written by write_columns and unlink the block"""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        columns = []
+        for code, nulls_offset, data_offset, data_length in layout:
+            nulls = bytes(block.buf[nulls_offset:nulls_offset + num_rows])
+            data = bytes(block.buf[data_offset:data_offset + data_length])
+            columns.append(_decode_column(code, data, nulls, num_rows))
+    finally:
+        block.close()
+        block.unlink()
+    return list(zip(*columns))
+
+
+def _heap_used():
+    try:
+        import jpype
+        runtime = jpype.JClass('java.lang.Runtime').getRuntime()
+        return int(runtime.totalMemory() - runtime.freeMemory())
+    except Exception:
+        return 0
+
+
+def _run_request(connections, request):
+    from .connection import Connection
+    op, key, con_json_dict, operation, parameters, timeout = request
+    conn = connections.get(key)
+    if conn is None:
+        conn = connections[key] = Connection(con_json_dict=con_json_dict)
+    cursor = conn.cursor()
+    try:
+        if op == 'executemany':
+            update_count = cursor.executemany(operation, parameters, timeout=timeout)
+            return None, update_count, None, None, 0
+        update_count = cursor.execute(operation, parameters, timeout=timeout)
+        if not cursor._has_result():
+            return None, update_count, None, None, 0
+        columns = cursor._columns
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return columns, update_count, None, None, 0
+    name, layout = write_columns(columns, rows)
+    return columns, update_count, name, layout, len(rows)
+
+
+def _worker_main(pipe, jvm_options):
+    """Serve requests of a WorkerPool until the pipe is closed or None is received"""
+    from .jvm import JVMOptions, configure_JVM
+    configure_JVM(JVMOptions(**jvm_options))
+    connections = {}
+    try:
+        while True:
+            try:
+                request = pipe.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            try:
+                reply = ('ok',) + _run_request(connections, request)
+            except Exception as ex:
+                error = type(ex).__name__ if isinstance(ex, Error) else 'DatabaseError'
+                reply = ('error', error, str(ex))
+            pipe.send(reply + (_heap_used(),))
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+
+class _Worker(object):
+    def __init__(self, context, jvm_options):
+        self.pipe, child_pipe = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_pipe, jvm_options),
+                                       name='pycalcite-worker', daemon=True)
+        self.process.start()
+        child_pipe.close()
+        self.queries = 0
+        self.heap_used = 0
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def stop(self, timeout=5):
+        try:
+            self.pipe.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.pipe.close()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class WorkerPool(object):
+    """Worker processes, each running its own JVM and CalciteBridge instances
+
+    Queries of ProcessConnection run in up to ``size`` spawned processes
+    (the CPU count by default) and their rows come back through shared
+    memory. A worker is replaced after ``max_queries`` queries, once its JVM
+    heap use exceeds ``max_heap_bytes`` or when it dies, so that a runaway
+    query only takes its own worker down. Workers start with the JVMOptions
+    configured in the parent process when they are spawned.
+    """
+
+    def __init__(self, size=None, max_queries=1000, max_heap_bytes=None):
+        self.size = size or os.cpu_count() or 2
+        self.max_queries = max_queries
+        self.max_heap_bytes = max_heap_bytes
+        self._context = multiprocessing.get_context('spawn')
+        self._cond = threading.Condition()
+        self._idle = []
+        self._alive = 0
+        self._counters = dict(started=0, recycled=0, died=0, queries=0)
+
+    def configure(self, **kwargs):
+        for name in ('size', 'max_queries', 'max_heap_bytes'):
+            if name in kwargs:
+                setattr(self, name, kwargs.pop(name))
+        if kwargs:
+            raise TypeError('unexpected worker pool options: %s' % ', '.join(sorted(kwargs)))
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._alive >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._alive += 1
+        from .jvm import get_JVM_options
+        try:
+            worker = _Worker(self._context, dict(get_JVM_options().__dict__))
+        except Exception:
+            self._retire(None)
+            raise
+        with self._cond:
+            self._counters['started'] += 1
+        return worker
+
+    def _release(self, worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def _retire(self, worker, counter=None):
+        with self._cond:
+            self._alive -= 1
+            if counter:
+                self._counters[counter] += 1
+            self._cond.notify()
+        if worker is not None:
+            worker.stop()
+
+    def run(self, request, on_worker=None):
+        """Send ``request`` to an idle worker and return its reply
+
+        ``on_worker`` is called with the worker before the request is sent
+        and with None once it answered, to let a cursor cancel the query.
+        """
+        worker = self._acquire()
+        if on_worker is not None:
+            on_worker(worker)
+        try:
+            worker.pipe.send(request)
+            reply = worker.pipe.recv()
+        except (EOFError, OSError) as ex:
+            logger.debug('worker %s died: %s' % (worker.pid, ex))
+            self._retire(worker, 'died')
+            raise OperationalError('worker process %s exited while running the query (exit code %s)'
+                                   % (worker.pid, worker.process.exitcode))
+        except BaseException:
+            # the reply may still come, the worker cannot be reused
+            self._retire(worker, 'died')
+            raise
+        finally:
+            if on_worker is not None:
+                on_worker(None)
+        worker.queries += 1
+        worker.heap_used = reply[-1]
+        with self._cond:
+            self._counters['queries'] += 1
+        if worker.queries >= self.max_queries or (self.max_heap_bytes and worker.heap_used > self.max_heap_bytes):
+            logger.debug('recycling worker %s after %d queries, heap %d bytes'
+                         % (worker.pid, worker.queries, worker.heap_used))
+            self._retire(worker, 'recycled')
+        else:
+            self._release(worker)
+        return reply[:-1]
+
+    def shutdown(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._alive -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats['idle'] = len(self._idle)
+            stats['alive'] = self._alive
+        return stats
+
+
+# shared by every ProcessConnection, tune it with worker_pool.configure(size=..., max_queries=...)
+worker_pool = WorkerPool()
+atexit.register(worker_pool.shutdown)
+
+
+def _raise_error(name, message):
+    error_class = getattr(calcite4py, name, None)
+    if not (isinstance(error_class, type) and issubclass(error_class, Error)):
+        error_class = DatabaseError
+    raise error_class(message)
+
+
+class ProcessCursor(Cursor):
+    """Cursor whose statements run in a WorkerPool process
+
+    The whole result is fetched by the worker and handed back through
+    shared memory when execute() returns, then served like a cached result.
+    The timeout and the time left to the deadline go with the statement and
+    are enforced by the worker, so the worker survives them; cancel() kills
+    the worker running the statement.
+    """
+    _worker = None
+
+    def _set_worker(self, worker):
+        with self._cancel_lock:
+            self._worker = worker
+            if worker is not None and self._cancelled:
+                worker.kill()
+
+    def _run(self, op, operation, parameters, timeout):
+        conn = self._conn
+        if conn._closed:
+            raise DatabaseError('Connection has been closed')
+        self._arm_timeout(timeout, start=False)
+        request = (op, conn.fingerprint, conn.con_json_dict, operation, parameters, self._timeout)
+        try:
+            reply = conn.worker_pool.run(request, self._set_worker)
+        except OperationalError:
+            self._raise_if_cancelled()
+            raise
+        if reply[0] == 'error':
+            _raise_error(reply[1], reply[2])
+        return reply[1:]
+
+    def execute(self, operation, parameters=None, timeout=None):
+        self._stop_prefetch()
+        self._close_last()
+        self._report_complete()
+        stats = self.stats = QueryStats(operation)
+        cache = self._result_cache(operation)
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(self._conn.fingerprint, operation, parameters)
+        if cache_key is None:
+            cache = None
+        else:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self._set_cached_result(cached)
+                stats.cache_hit = True
+                if HOOKS:
+                    emit('execute', self, stats)
+                return cached.update_count
+        start = time.perf_counter()
+        columns, update_count, name, layout, num_rows = self._run('execute', operation, parameters, timeout)
+        stats.execute = time.perf_counter() - start
+        self.rowcount = update_count
+        if columns is None:
+            self._set_result_set(None)
+            self._invalidate_result_cache()
+        else:
+            start = time.perf_counter()
+            rows = read_columns(name, layout, num_rows) if name else []
+            stats.fetch += time.perf_counter() - start
+            cached = CachedResult(columns, rows, update_count)
+            if cache is not None:
+                cache.put(cache_key, cached)
+            self._set_cached_result(cached)
+        if HOOKS:
+            emit('execute', self, stats)
+        return update_count
+
+    def executemany(self, operation, seq_of_parameters, batch_size=None, timeout=None):
+        if iter(seq_of_parameters) is seq_of_parameters:
+            # generators and zip objects cannot be pickled
+            seq_of_parameters = list(seq_of_parameters)
+        self._stop_prefetch()
+        self._close_last()
+        self._report_complete()
+        self.stats = QueryStats(operation)
+        self.rowcount = self._run('executemany', operation, seq_of_parameters, timeout)[1]
+        self._invalidate_result_cache()
+        return self.rowcount
+
+    def _cancel(self):
+        self._cancelled = True
+        worker = self._worker
+        if worker is not None:
+            worker.kill()
+
+
+class ProcessConnection(object):
+    """DB-API connection running its statements in worker processes
+
+    Opened by ``pycalcite.connect(..., isolation='process')``. Every worker
+    of ``worker_pool`` keeps its own JVM and bridges, so a query exhausting
+    the heap or crashing the JVM fails alone and the worker is replaced.
+    Reflection needs the CalciteBridge itself and is not available, and
+    results are fetched whole by the worker, also for streaming cursors.
+    Programs using it must guard their entry point with
+    ``if __name__ == '__main__':`` as workers are spawned.
+    """
+
+    def __init__(self, username=None, password=None, host=None, port=None, database=None, **kwargs):
+        from .connection import _result_cache_option, _timeout_option
+        self.host = host
+        self.database = database
+        self.username = username
+        self.con_json_dict = dict(kwargs.get('con_json_dict', {}))
+        json_dct = dict(self.con_json_dict)
+        lex = json_dct.pop('lex', 'MYSQL')
+        self.fingerprint = fingerprint(json.dumps(json_dct), lex)
+        self.worker_pool = kwargs.get('worker_pool') or worker_pool
+        self.result_cache = _result_cache_option(kwargs.get('result_cache'))
+        self.query_timeout = _timeout_option(kwargs.get('query_timeout'))
+        self._closed = False
+        self._cursor = None
+
+    @property
+    def conn(self):
+        raise NotSupportedError('the CalciteBridge of a process isolated connection lives in its worker')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._cursor:
+            self._cursor.close()
+        self._closed = True
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        logger.warn('Transactional rollback is not supported')
+
+    def cursor(self, streaming=False, fetch_size=None):
+        self._cursor = ProcessCursor(self)
+        return self._cursor
+
+    def reconnect(self):
+        self._closed = False
+
+    def connection_closed(self):
+        return self._closed
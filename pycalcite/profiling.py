@@ -0,0 +1,123 @@
+from __future__ import absolute_import
+
+import sys
+import time
+
+from .log import logger
+
+# registered hooks; cursors test the list before building any event so that
+# an empty registry costs one truth test per execute
+HOOKS = []
+
+
+def register_hook(hook):
+    """Call ``hook(event, cursor, stats)`` for every query of the process
+
+    ``event`` is 'execute' once the statement ran and 'complete' once the
+    result set is closed, i.e. when the cursor runs its next statement or is
+    closed. Exceptions raised by a hook are logged and swallowed.
+    """
+    if hook not in HOOKS:
+        HOOKS.append(hook)
+    return hook
+
+
+def unregister_hook(hook):
+    if hook in HOOKS:
+        HOOKS.remove(hook)
+
+
+def emit(event, cursor, stats):
+    for hook in list(HOOKS):
+        try:
+            hook(event, cursor, stats)
+        except Exception as ex:
+            logger.debug('profiling hook %r failed: %s' % (hook, ex))
+
+
+def _row_size(rows):
+    row = rows[0]
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class QueryStats(object):
+    """Phase timings of the last statement of a cursor, in seconds
+
+    ``attach`` is the JVM thread attach, ``statement`` the statement creation
+    or the parameter binding, ``plan`` the parse/validate/plan/code generation
+    done by prepareStatement() (None for statements without parameters, whose
+    planning is part of ``execute``), ``first_row`` the time from the start
+    of execute() to the first fetched row and ``fetch`` the time spent
+    fetching and converting rows. ``bytes`` is estimated from the size of the
+    first fetched row.
+    """
+
+    __slots__ = ('sql', 'cache_hit', 'attach', 'statement', 'plan', 'execute', 'first_row', 'fetch',
+                 'rows', 'row_size', 'started', 'reported')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.cache_hit = False
+        self.attach = 0.0
+        self.statement = 0.0
+        self.plan = None
+        self.execute = 0.0
+        self.first_row = None
+        self.fetch = 0.0
+        self.rows = 0
+        self.row_size = None
+        self.started = time.perf_counter()
+        self.reported = False
+
+    @property
+    def bytes(self):
+        return self.rows * (self.row_size or 0)
+
+    def add_rows(self, rows, elapsed):
+        """Account ``rows`` (a sequence of row tuples or a row count) fetched in ``elapsed`` seconds"""
+        self.fetch += elapsed
+        count = rows if isinstance(rows, int) else len(rows)
+        if not count:
+            return
+        if self.first_row is None:
+            self.first_row = time.perf_counter() - self.started
+        if self.row_size is None and not isinstance(rows, int):
+            self.row_size = _row_size(rows)
+        self.rows += count
+
+    def as_dict(self):
+        return dict(sql=self.sql, cache_hit=self.cache_hit, attach=self.attach, statement=self.statement,
+                    plan=self.plan, execute=self.execute, first_row=self.first_row, fetch=self.fetch,
+                    rows=self.rows, bytes=self.bytes)
+
+    def __repr__(self):
+        return '<QueryStats %s>' % ', '.join('%s=%r' % item for item in sorted(self.as_dict().items())
+                                               if item[0] != 'sql')
+
+
+def instrument_engine(engine):
+    """Expose the QueryStats of every statement run through a SQLAlchemy engine
+
+    After a statement ran, ``context.pycalcite_stats`` and
+    ``conn.info['pycalcite_stats']`` hold the stats of its cursor, so that
+    ``after_cursor_execute`` listeners registered later can read them; the
+    fetch figures keep filling in while the result is consumed.
+    """
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # no stale stats from the previous statement if this one fails
+        conn.info.pop('pycalcite_stats', None)
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(cursor, 'stats', None)
+        if stats is None:
+            return
+        if context is not None:
+            context.pycalcite_stats = stats
+        conn.info['pycalcite_stats'] = stats
+        logger.debug('statement stats: %r' % stats)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    return engine
@@ -0,0 +1,114 @@
+from __future__ import absolute_import
+
+import bisect
+import mmap
+import tempfile
+from collections.abc import Sequence
+
+from .log import logger
+from .codec import _column_code, _decode_column, encode_rows
+
+
+class SpillFile(object):
+    """Append-only temp file holding rows in column-wise chunks
+
+    Every append() writes one chunk with the null mask and the encoded
+    values of each column (see codec.py), the layout process.write_columns
+    uses for shared memory. The file is unlinked on creation and goes away
+    once closed.
+    """
+
+    def __init__(self, columns, directory=None):
+        self._codes = [_column_code(column[2]) for column in columns]
+        self._file = tempfile.TemporaryFile(prefix='pycalcite-spill-', dir=directory)
+        self._offset = 0
+        # (first row, number of rows, [(code, nulls offset, data offset, data length)])
+        self._chunks = []
+        self.num_rows = 0
+
+    def append(self, rows):
+        if not rows:
+            return
+        layout = []
+        for code, (nulls, data) in zip(self._codes, encode_rows(self._codes, rows)):
+            layout.append((code, self._offset, self._offset + len(nulls), len(data)))
+            self._file.write(nulls)
+            self._file.write(data)
+            self._offset += len(nulls) + len(data)
+        self._chunks.append((self.num_rows, len(rows), layout))
+        self.num_rows += len(rows)
+
+    def finish(self):
+        """Map the file read-only and return its rows as a SpilledRows"""
+        self._file.flush()
+        logger.debug('spilled %d rows, %d bytes' % (self.num_rows, self._offset))
+        return SpilledRows(self._file, self._chunks, self.num_rows)
+
+    def close(self):
+        self._file.close()
+
+
+class SpilledRows(Sequence):
+    """Read-only sequence over the rows of a SpillFile
+
+    Rows are decoded from the memory-mapped file one chunk at a time, so
+    the resident memory is one chunk of row tuples whatever the length.
+    Indexing decodes the chunk of the row and keeps it for the next access;
+    iterate rather than index to read everything. close() releases the map
+    and the file. Rows are tuples of the values the cursor returns for rows
+    kept in memory; in lazy mode they replace the Row views.
+    """
+
+    def __init__(self, file, chunks, num_rows):
+        self._file = file
+        self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if num_rows else None
+        self._chunks = chunks
+        self._starts = [chunk[0] for chunk in chunks]
+        self._num_rows = num_rows
+        self._cached_index = None
+        self._cached_rows = None
+
+    def __len__(self):
+        return self._num_rows
+
+    def _decode(self, index):
+        first, num_rows, layout = self._chunks[index]
+        data = self._map
+        columns = [_decode_column(code, data[data_offset:data_offset + data_length],
+                                  data[nulls_offset:nulls_offset + num_rows], num_rows)
+                   for code, nulls_offset, data_offset, data_length in layout]
+        return list(zip(*columns))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._num_rows))]
+        if index < 0:
+            index += self._num_rows
+        if not 0 <= index < self._num_rows:
+            raise IndexError('row index out of range')
+        chunk = bisect.bisect_right(self._starts, index) - 1
+        if chunk != self._cached_index:
+            self._cached_rows = self._decode(chunk)
+            self._cached_index = chunk
+        return self._cached_rows[index - self._starts[chunk]]
+
+    def __iter__(self):
+        for index in range(len(self._chunks)):
+            for row in self._decode(index):
+                yield row
+
+    def __repr__(self):
+        return '<SpilledRows of %d rows>' % self._num_rows
+
+    def close(self):
+        self._cached_rows = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
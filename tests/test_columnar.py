@@ -0,0 +1,16 @@
+"""Arrow types of the JDBC column types"""
+import pytest
+
+from pycalcite.columnar import _arrow_type
+
+pa = pytest.importorskip('pyarrow')
+
+
+@pytest.mark.parametrize('col_type, arrow_type', [
+    (7, 'float'),  # REAL
+    (6, 'double'),  # FLOAT is double precision in JDBC
+    (8, 'double'),  # DOUBLE
+    (3, 'double'),  # DECIMAL
+])
+def test_floating_point_types(col_type, arrow_type):
+    assert str(_arrow_type(pa, col_type)) == arrow_type
@@ -0,0 +1,157 @@
+"""Connection life cycle over a pooled fake CalciteBridge, no JVM needed"""
+import jpype
+import pytest
+
+from pycalcite import connection
+from pycalcite.pool import BridgePool
+
+
+class FakeMetaData(object):
+    def getColumnCount(self):
+        return 1
+
+    def getColumnName(self, index):
+        return 'X'
+
+    def getColumnType(self, index):
+        return 4  # java.sql.Types.INTEGER
+
+    def getColumnTypeName(self, index):
+        return 'INTEGER'
+
+    def isNullable(self, index):
+        return 1
+
+
+class FakeResultSet(object):
+    def __init__(self):
+        self.closed = False
+        self._rows = 3
+
+    def getMetaData(self):
+        return FakeMetaData()
+
+    def next(self):
+        self._rows -= 1
+        return self._rows >= 0
+
+    def getInt(self, index):
+        return self._rows
+
+    def wasNull(self):
+        return False
+
+    def setFetchSize(self, size):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeProperties(dict):
+    """java.util.Properties of a CalciteConnection"""
+
+    def getProperty(self, name):
+        return self.get(name)
+
+    def setProperty(self, name, value):
+        self[name] = value
+
+    def remove(self, name):
+        self.pop(name, None)
+
+
+class FakeJdbcConnection(object):
+    def __init__(self, properties):
+        self._properties = properties
+
+    def isClosed(self):
+        return False
+
+    def unwrap(self, interface):
+        # the CalciteConnection is the java.sql.Connection itself
+        return self
+
+    def getProperties(self):
+        return self._properties
+
+
+class FakeStatement(object):
+    def __init__(self, bridge):
+        self._bridge = bridge
+        self.closed = False
+        self.result_set = None
+
+    def execute(self, operation):
+        self.result_set = FakeResultSet()
+        return True
+
+    def setFetchSize(self, size):
+        pass
+
+    def getUpdateCount(self):
+        return -1
+
+    def getResultSet(self):
+        return self.result_set
+
+    def getConnection(self):
+        return FakeJdbcConnection(self._bridge.properties)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBridge(object):
+    def __init__(self):
+        self.statements = []
+        self.closed = False
+        self.properties = FakeProperties()
+
+    def createStatement(self):
+        stmt = FakeStatement(self)
+        self.statements.append(stmt)
+        return stmt
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = BridgePool(lambda json_str, lex: FakeBridge())
+    monkeypatch.setattr(connection, 'bridge_pool', pool)
+    return pool
+
+
+def test_close_closes_every_cursor_before_releasing_the_bridge(pool):
+    conn = connection.Connection(con_json_dict={'version': '1.0'})
+    bridge = conn.conn
+    cursors = [conn.cursor(), conn.cursor(), conn.cursor(streaming=True)]
+    for cursor in cursors:
+        cursor.execute('select x from t')
+        cursor.fetchone()
+    conn.close()
+    executed = [stmt for stmt in bridge.statements if stmt.result_set is not None]
+    assert len(executed) == len(cursors)
+    assert all(stmt.closed and stmt.result_set.closed for stmt in executed)
+    assert pool.stats()['idle'] == 1
+    # the next connection of the model gets the clean bridge
+    assert connection.Connection(con_json_dict={'version': '1.0'}).conn is bridge
+
+
+def test_materializations_setting_does_not_leak_to_the_next_connection(pool, monkeypatch):
+    monkeypatch.setattr(jpype, 'JClass', lambda name: name)
+    conn = connection.Connection(con_json_dict={'version': '1.0'}, materializations_enabled=True)
+    bridge = conn.conn
+    assert bridge.properties == {'materializationsEnabled': 'true'}
+    conn.close()
+    assert bridge.properties == {}
+    bridge.properties['materializationsEnabled'] = 'false'
+    conn = connection.Connection(con_json_dict={'version': '1.0'}, materializations_enabled=True)
+    assert conn.conn is bridge and bridge.properties == {'materializationsEnabled': 'true'}
+    conn.close()
+    assert bridge.properties == {'materializationsEnabled': 'false'}
+    conn = connection.Connection(con_json_dict={'version': '1.0'})
+    assert conn.conn is bridge and bridge.properties == {'materializationsEnabled': 'false'}
+    conn.close()
@@ -0,0 +1,68 @@
+"""SQLAlchemy integration of the dialect that needs no JVM"""
+import warnings
+
+import sqlalchemy as sa
+
+from pycalcite.dialect import PyCalciteDialect, _type_map
+
+
+def test_select_over_every_type_has_a_cache_key():
+    metadata = sa.MetaData()
+    table = sa.Table('t', metadata, *[sa.Column('c%d' % i, type_) for i, type_ in enumerate(_type_map.values())])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', sa.exc.SAWarning)
+        key = sa.select(*table.c)._generate_cache_key()
+    assert key is not None
+
+
+class FakeMetaInfo(object):
+    def __init__(self, schema, table, column=None, column_type='INTEGER'):
+        self._values = dict(SchemaName=schema, TableName=table, ColumnName=column, Nullable=1)
+        self._column_type = column_type
+
+    def __getattr__(self, name):
+        if not name.startswith('get'):
+            raise AttributeError(name)
+        return lambda: self._values[name[3:]]
+
+    def getColumnType(self):
+        # a java.lang.String, see _column_info()
+        return FakeJavaString(self._column_type)
+
+
+class FakeJavaString(str):
+    def toLowerCase(self):
+        return self.lower()
+
+
+class FakeBridge(object):
+    """CalciteBridge metadata of two schemas with a same-named table and a view"""
+    columns = [('s1', 'T', 'A'), ('s1', 'T', 'B'), ('s1', 'V', 'X'), ('s2', 'T', 'C'), ('s2', 'U', 'D')]
+    tables = [('s1', 'T'), ('s2', 'T'), ('s2', 'U')]
+
+    def getTablesMetaInfo(self, catalog, schema, table, types):
+        assert list(types) == ['TABLE']
+        return [FakeMetaInfo(*row) for row in self.tables if schema in (None, row[0])]
+
+    def getTableColumnsMetaInfo(self, catalog, schema, table, column):
+        return [FakeMetaInfo(*row) for row in self.columns
+                if schema in (None, row[0]) and table in (None, row[1])]
+
+
+class FakeConnection(object):
+    """SQLAlchemy Connection wrapping a pycalcite Connection over FakeBridge"""
+
+    def __init__(self):
+        pycalcite_connection = type('Connection', (object,), dict(conn=FakeBridge(), fingerprint='fake'))()
+        self.connection = type('ConnectionFairy', (object,), dict(connection=pycalcite_connection))()
+
+
+def test_multi_columns_report_tables_only_without_merging_schemas():
+    dialect = PyCalciteDialect()
+    columns = dict(dialect.get_multi_columns(FakeConnection()))
+    assert sorted(columns) == [(None, 'T'), (None, 'U')]
+    assert [column['name'] for column in columns[(None, 'T')]] == ['A', 'B']
+    assert [column['name'] for column in dialect.get_columns(FakeConnection(), 'T')] == ['A', 'B']
+    columns = dict(dialect.get_multi_columns(FakeConnection(), schema='s2', filter_names=['T', 'V']))
+    assert list(columns) == [('s2', 'T')]
+    assert [column['name'] for column in columns[('s2', 'T')]] == ['C']
@@ -0,0 +1,76 @@
+"""execute_many_parallel() against fake connections, no JVM needed"""
+import threading
+import time
+
+import pytest
+
+from pycalcite import parallel
+
+
+class FakeCursor(object):
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = None
+
+    def execute(self, operation, parameters=None):
+        self._conn.executed.append((operation, parameters))
+        if operation.startswith('fail'):
+            raise ValueError(operation)
+        # later queries finish first, results must still come back in query order
+        time.sleep(0.05 / (1 + len(operation)))
+        self._rows = [(operation, parameters, threading.current_thread().name)]
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection(object):
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.executed = []
+        self.closed = False
+        FakeConnection.opened.append(self)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    FakeConnection.opened = []
+    monkeypatch.setattr(parallel, 'Connection', FakeConnection)
+    return FakeConnection.opened
+
+
+def test_rows_come_back_in_query_order(connections):
+    queries = ['select %s' % ('x' * i) for i in range(8)] + [('select ?', (1,))]
+    results = parallel.execute_many_parallel(queries, max_workers=4, con_json_dict={'version': '1.0'})
+    assert [rows[0][:2] for rows in results] == [(sql, None) for sql in queries[:-1]] + [('select ?', (1,))]
+    assert all(rows[0][2].startswith('pycalcite-parallel') for rows in results)
+
+
+def test_one_connection_per_query(connections):
+    queries = ['select %d' % i for i in range(6)]
+    parallel.execute_many_parallel(queries, max_workers=3, con_json_dict={'version': '1.0'})
+    assert len(connections) == len(queries)
+    assert sorted(conn.executed[0][0] for conn in connections) == sorted(queries)
+    assert all(len(conn.executed) == 1 and conn.closed for conn in connections)
+    assert all(conn.kwargs == {'con_json_dict': {'version': '1.0'}} for conn in connections)
+
+
+def test_first_error_raised_after_every_query_ran(connections):
+    queries = ['select 1', 'fail 2', 'select 3', 'fail 4', 'select 5']
+    with pytest.raises(ValueError) as raised:
+        parallel.execute_many_parallel(queries, max_workers=2)
+    assert str(raised.value) == 'fail 2'
+    assert sorted(conn.executed[0][0] for conn in connections) == sorted(queries)
+    # failed queries close their connection too
+    assert all(conn.closed for conn in connections)
+
+
+def test_no_queries(connections):
+    assert parallel.execute_many_parallel([]) == []
+    assert connections == []
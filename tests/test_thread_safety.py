@@ -0,0 +1,296 @@
+"""Concurrent use of StatementCache, BridgePool and cursors against fake JDBC objects
+
+No JVM is started: the fakes below stand in for the CalciteBridge, its
+java.sql.Connection and the statements and result sets they hand out, and
+attach_JVM_thread() is a no-op while the JVM is down.
+"""
+import threading
+import time
+
+import pytest
+
+from pycalcite.calcite4py import Cursor, OperationalError, StatementCache
+from pycalcite.pool import BridgePool
+
+THREADS = 8
+ROUNDS = 200
+
+
+class FakeMetaData(object):
+    def getColumnCount(self):
+        return 1
+
+    def getColumnName(self, index):
+        return 'X'
+
+    getColumnLabel = getColumnName
+
+    def getColumnType(self, index):
+        return -5  # java.sql.Types.BIGINT
+
+    def getColumnTypeName(self, index):
+        return 'BIGINT'
+
+    def isNullable(self, index):
+        return 1
+
+
+class FakeResultSet(object):
+    def __init__(self, values):
+        self._values = values
+        self._pos = -1
+
+    def getMetaData(self):
+        return FakeMetaData()
+
+    def next(self):
+        self._pos += 1
+        return self._pos < len(self._values)
+
+    def getLong(self, index):
+        return self._values[self._pos]
+
+    def wasNull(self):
+        return False
+
+    def setFetchSize(self, size):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeStatement(object):
+    """PreparedStatement failing loudly when two threads use it at the same time"""
+
+    def __init__(self, sql, block=None):
+        self.sql = sql
+        self.closed = False
+        self.cancelled = threading.Event()
+        self._block = block
+        self._user = threading.Lock()
+        self._values = {}
+
+    def _enter(self):
+        if not self._user.acquire(False):
+            raise AssertionError('statement shared by two threads: %s' % self.sql)
+
+    def setLong(self, index, value):
+        self._values[index] = value
+
+    def clearParameters(self):
+        self._values = {}
+
+    def setFetchSize(self, size):
+        pass
+
+    def setQueryTimeout(self, seconds):
+        pass
+
+    def execute(self, operation=None):
+        self._enter()
+        try:
+            if self._block is not None:
+                self._block.set()
+                if not self.cancelled.wait(5):
+                    raise AssertionError('statement was not cancelled')
+                raise RuntimeError('statement cancelled')
+            # widen the window for a second thread to get the same statement
+            time.sleep(0.0005)
+            value = self._values.get(1)
+            self._rs = FakeResultSet([value, value + 1])
+            return True
+        finally:
+            self._user.release()
+
+    def getUpdateCount(self):
+        return -1
+
+    def getResultSet(self):
+        return self._rs
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def close(self):
+        self.closed = True
+
+
+class FakeJdbcConnection(object):
+    def __init__(self, block=None):
+        self.prepared = []
+        self._block = block
+        self._lock = threading.Lock()
+
+    def prepareStatement(self, sql):
+        stmt = FakeStatement(sql, self._block)
+        with self._lock:
+            self.prepared.append(stmt)
+        return stmt
+
+
+class FakeConnection(object):
+    """The attributes of pycalcite.connection.Connection a Cursor reads"""
+    _closed = False
+    fingerprint = 'fake'
+    result_cache = None
+
+    def __init__(self, block=None, cache_size=64):
+        self.conn = self.jdbc = FakeJdbcConnection(block)
+        self.statement_cache = StatementCache(lambda: self.jdbc, cache_size)
+
+
+def run_threads(target, count=THREADS):
+    errors = []
+
+    def guarded(number):
+        try:
+            target(number)
+        except BaseException as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=guarded, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert not any(thread.is_alive() for thread in threads)
+    if errors:
+        raise errors[0]
+
+
+def test_statement_cache_never_hands_out_a_statement_twice():
+    jdbc = FakeJdbcConnection()
+    cache = StatementCache(lambda: jdbc, size=4)
+    sqls = ['select %d' % number for number in range(6)]
+
+    def work(number):
+        for i in range(ROUNDS):
+            sql = sqls[(number + i) % len(sqls)]
+            stmt = cache.checkout(sql)
+            stmt._enter()
+            try:
+                assert stmt.sql == sql and not stmt.closed
+            finally:
+                stmt._user.release()
+            cache.checkin(sql, stmt)
+
+    run_threads(work)
+    assert cache.hits + cache.misses == THREADS * ROUNDS
+    assert cache.misses == len(jdbc.prepared)
+    cached = list(cache._statements.values())
+    assert len(cached) <= cache.size
+    # every statement is either kept once or closed, none leaks
+    assert len(set(map(id, cached))) == len(cached)
+    assert all(not stmt.closed for stmt in cached)
+    assert sum(not stmt.closed for stmt in jdbc.prepared) == len(cached)
+    cache.clear()
+    assert all(stmt.closed for stmt in jdbc.prepared)
+
+
+class FakeBridge(object):
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.holder = None
+
+    def close(self):
+        self.closed = True
+
+
+def test_bridge_pool_checks_out_each_bridge_once():
+    created = []
+    lock = threading.Lock()
+
+    def factory(json_str, lex):
+        with lock:
+            bridge = FakeBridge(len(created))
+            created.append(bridge)
+        return bridge
+
+    pool = BridgePool(factory, max_size=3, health_check=False)
+
+    def work(number):
+        for i in range(ROUNDS):
+            key = 'model%d' % (i % 2)
+            bridge = pool.acquire(key, '{}')
+            assert bridge.holder is None and not bridge.closed
+            bridge.holder = number
+            time.sleep(0)
+            assert bridge.holder == number
+            bridge.holder = None
+            pool.release(key, bridge)
+
+    run_threads(work)
+    stats = pool.stats()
+    assert stats['in_use'] == 0
+    assert stats['created'] == len(created)
+    assert stats['created'] + stats['reused'] == THREADS * ROUNDS
+    assert stats['released'] + stats['discarded'] == THREADS * ROUNDS
+    assert stats['idle'] <= 2 * pool.max_size
+    pool.clear()
+    assert all(bridge.closed for bridge in created)
+
+
+def test_bridge_pool_invalidate_while_bridges_are_checked_out():
+    pool = BridgePool(lambda json_str, lex: FakeBridge(0), health_check=False)
+
+    def work(number):
+        for i in range(ROUNDS):
+            generation = pool.generation('model')
+            bridge = pool.acquire('model', '{}')
+            if number == 0 and i % 10 == 0:
+                pool.invalidate('model')
+            pool.release('model', bridge, discard=pool.generation('model') != generation)
+
+    run_threads(work)
+    assert pool.stats()['in_use'] == 0
+    assert pool.generation('model') == ROUNDS // 10
+
+
+def test_cursors_of_one_connection_get_their_own_statements():
+    conn = FakeConnection(cache_size=2)
+
+    def work(number):
+        cursor = Cursor(conn)
+        for i in range(ROUNDS // 4):
+            value = number * 1000 + i
+            cursor.execute('select x from t where x = %s', (value,))
+            assert cursor.fetchall() == [(value,), (value + 1,)]
+        cursor.close()
+
+    run_threads(work)
+    assert conn.statement_cache.hits + conn.statement_cache.misses == THREADS * (ROUNDS // 4)
+    assert len(conn.statement_cache._statements) <= 1
+
+
+def test_cancel_from_another_thread():
+    executing = threading.Event()
+    conn = FakeConnection(block=executing)
+    cursor = Cursor(conn)
+    result = []
+
+    def execute():
+        try:
+            cursor.execute('select x from t where x = %s', (1,))
+        except OperationalError as ex:
+            result.append(ex)
+
+    thread = threading.Thread(target=execute)
+    thread.start()
+    assert executing.wait(5)
+    cursor.cancel()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(result) == 1 and 'cancelled' in str(result[0])
+    stmt, = conn.jdbc.prepared
+    # a cancelled statement is closed rather than cached for the next cursor
+    assert stmt.cancelled.is_set() and stmt.closed
+    assert not conn.statement_cache._statements
+
+
+def test_cancel_without_statement_is_harmless():
+    cursor = Cursor(FakeConnection())
+    cursor.cancel()
+    with pytest.raises(OperationalError):
+        cursor._raise_if_cancelled()